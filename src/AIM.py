@@ -1,12 +1,81 @@
 import scipy.io as sio
 import scipy.signal as sig
+import scipy.fft as sfft
 import numpy as np
 import cv2
 import time
 import math
+import os
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
+#pyFFTW is optional, if available it is used as the scipy.fft backend and its plans (wisdom)
+#are kept on disk between runs
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft as fftwBackend
+    import pickle
+except ImportError:
+    pyfftw = None
+
+#path of the compiled basis for a .mat basis file (the .mat path with .npy extension)
+def getCompiledBasisPath(basisMatPath):
+    return os.path.splitext(basisMatPath)[0] + '.npy'
+
+#returns the basis as a (numFilters, kernelSize, kernelSize, 3) array of flipped kernels
+def readBasisMat(basisMatPath):
+    B = sio.loadmat(basisMatPath)['B'].astype(np.float32)
+    B = np.asfortranarray(B)
+    kernel_size = int(math.sqrt(B.shape[1]/3))
+    print(B.shape, kernel_size)
+    basis = np.reshape(B, (B.shape[0], kernel_size, kernel_size, 3), order='F')
+
+    #AIM requires correlation operation, but since scipy only has convolution available
+    #we need to flip the kernels vertically and horizontally
+    return np.ascontiguousarray(basis[:, ::-1, ::-1, :])
+
+#save the flipped basis as a contiguous .npy next to the .mat file, so that loading is a memory map
+def compileBasis(basisMatPath):
+    basisPath = getCompiledBasisPath(basisMatPath)
+    basis = readBasisMat(basisMatPath)
+
+    #write to a temporary file first so that running jobs never see partial files
+    tmpPath = '{}.{}.tmp.npy'.format(basisPath[:-4], os.getpid())
+    np.save(tmpPath, basis)
+    os.replace(tmpPath, basisPath)
+    return basisPath
+
+NUM_BINS = 256 #number of histogram bins for the feature maps
+FILTER_CHUNK = 4 #number of filters processed by one task of the thread pool
+ROW_CHUNK = 64 #number of rows of the feature maps processed by one task of the thread pool
+
+#AIMMode:
+#   fft - each image channel is transformed once and all feature maps are computed with one batched
+#         multiply and inverse FFT, with the kernel spectra cached for the working image size
+#   reference - one fftconvolve per filter and channel (original implementation)
+#   separable - each kernel channel is approximated by its first singular components and convolved
+#               with cv2.sepFilter2D. The number of components is set by rank, or if rank is 0, it is
+#               the smallest one which keeps the given fraction of the kernel energy
+#fft and reference produce the same feature maps up to float32 rounding, for the approximation error of
+#separable run this file with --separable-error
+#
+#memoryBudget (in MB) limits the memory used for the feature maps. If the whole image does not fit,
+#the feature maps are computed in strips of rows (with a halo of kernelSize-1 input rows) and spilled to
+#a temporary file in spillDir, which is then read back to compute the histograms and the self-information
+#one strip at a time. 0 processes the whole image at once
+#
+#threads > 1 runs the convolution of the filters (in chunks of FILTER_CHUNK) and the other stages over
+#the rows of the feature maps (in chunks of ROW_CHUNK) on a thread pool. The chunks do not depend on the number of threads and every output value
+#is computed by one task in the same order as in the serial case, so the results are bit-identical
+#for any number of threads
+#
+#cores - number of cores AIM may use (None - all of them). With threads <= 1 every FFT is split over
+#all the cores, otherwise the threads already use them and every FFT runs on one core. Several processes
+#running AIM (see Controller.runWorkers) must divide the cores between them, or each of them would use all
+#of them and the processes would slow each other down
 class AIM:
-    def __init__(self, basisMatPath='data/21infomax900.mat'):
+    def __init__(self, basisMatPath='data/21infomax900.mat', mode='fft', wisdomPath=None, rank=0, energy=0.99, memoryBudget=0, spillDir=None, threads=1, cores=None):
 
         self.scale = 1
         self.origH = -1
@@ -17,21 +86,42 @@ class AIM:
         self.aimTemp = None
         self.sm = None
 
+        self.mode = mode
+        #use all available cores for the FFTs, unless the filters are already split between threads
+        if threads > 1:
+            self.workers = 1
+        else:
+            self.workers = cores if cores else -1
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.basisSpectra = None
+        self.fftShape = None
+
+        if self.mode not in ['fft', 'reference', 'separable']:
+            raise ValueError('Unrecognized AIMMode {}! Use fft, reference or separable.'.format(self.mode))
+
+        self.wisdomPath = wisdomPath
+        if pyfftw is not None:
+            self.loadWisdom()
+
         self.loadBasis(basisMatPath)
 
-    def loadBasis(self, basisMatPath):
-        B = sio.loadmat(basisMatPath)['B'].astype(np.float32)
-        B = np.asfortranarray(B)
-        kernel_size = int(math.sqrt(B.shape[1]/3))
-        print(B.shape, kernel_size)
-        self.basis = np.reshape(B, (B.shape[0], kernel_size, kernel_size, 3), order='F')
+        self.memoryBudget = memoryBudget
+        self.spillDir = spillDir
 
-        #AIM requires correlation operation, but since scipy only has convolution available
-        #we need to flip the kernels vertically and horizontally
-        for i in range(self.basis.shape[0]):
-            for j in range(self.basis.shape[3]):
-                self.basis[i, :, :, j] = np.fliplr(np.flipud(self.basis[i, :, :, j]))
+        self.rank = rank
+        self.energy = energy
+        self.sepComponents = None
+        if self.mode == 'separable':
+            self.decomposeBasis()
 
+    def loadBasis(self, basisMatPath):
+        #use the compiled basis if there is an up-to-date one next to the .mat file
+        #it is memory-mapped read-only, so processes running AIM share the same pages
+        basisPath = getCompiledBasisPath(basisMatPath)
+        if os.path.exists(basisPath) and (not os.path.exists(basisMatPath) or os.path.getmtime(basisPath) >= os.path.getmtime(basisMatPath)):
+            self.basis = np.load(basisPath, mmap_mode='r')
+        else:
+            self.basis = readBasisMat(basisMatPath)
 
     def loadImage(self, img):
         self.img = img.copy()
@@ -42,58 +132,293 @@ class AIM:
 
         self.newH = int(img.shape[0]*(self.newW/img.shape[1]))
         self.img = cv2.resize(self.img, (self.newW, self.newH), interpolation=cv2.INTER_AREA)
-        self.aimTemp = np.zeros((self.img.shape[0]-self.basis.shape[1]+1, self.img.shape[1]-self.basis.shape[1]+1, self.basis.shape[0]), dtype=np.float32)
+        #allocated in computeSaliency, since it is not kept for the whole image in tiled mode
+        self.aimTemp = None
 
 
-    def computeSaliency(self):
-        border = round(self.basis.shape[1]/2)
+    def loadWisdom(self):
+        if self.wisdomPath and os.path.exists(self.wisdomPath):
+            with open(self.wisdomPath, 'rb') as f:
+                pyfftw.import_wisdom(pickle.load(f))
+        pyfftw.interfaces.cache.enable()
 
-        imgCopy = self.img.copy()
+    def saveWisdom(self):
+        if not self.wisdomPath:
+            return
+        tmpPath = '{}.{}.tmp'.format(self.wisdomPath, os.getpid())
+        with open(tmpPath, 'wb') as f:
+            pickle.dump(pyfftw.export_wisdom(), f)
+        os.replace(tmpPath, self.wisdomPath)
 
-        #AIM kernels are ordered for RGB channels
-        #so convert the image from BGR to RGB
-        imgCopy = imgCopy[...,::-1]
-        #t0 = time.time()
+    #spectra of all kernels for the FFT size of the current image (or tile), recomputed only when the size changes
+    def updateBasisSpectra(self, imgH, imgW):
+        kernelSize = self.basis.shape[1]
+        fullH = imgH + kernelSize - 1
+        fullW = imgW + kernelSize - 1
+        fftShape = (sfft.next_fast_len(fullH, real=True), sfft.next_fast_len(fullW, real=True))
+
+        if fftShape == self.fftShape:
+            return
+
+        self.fftShape = fftShape
+        self.basisSpectra = sfft.rfft2(self.basis, s=fftShape, axes=(1, 2), workers=self.workers)
+        if pyfftw is not None:
+            self.saveWisdom()
+
+    #runs fn(chunk) for slices of chunkSize covering range(n), on the thread pool if there is one
+    def forChunks(self, fn, n, chunkSize):
+        chunks = [slice(i, min(i + chunkSize, n)) for i in range(0, n, chunkSize)]
+        if self.pool is None:
+            return [fn(chunk) for chunk in chunks]
+        return list(self.pool.map(fn, chunks))
+
+    #the scipy.fft backend is set per thread, so every task sets it
+    def getFFTBackend(self):
+        if pyfftw is None:
+            return contextlib.nullcontext()
+        return sfft.set_backend(fftwBackend)
+
+    #computes the valid part of the feature maps of imgCopy into out (of shape h x w x numFilters)
+    def convolve(self, imgCopy, out):
+        numFilters = self.basis.shape[0]
+        if self.mode == 'fft':
+            with self.getFFTBackend():
+                self.updateBasisSpectra(imgCopy.shape[0], imgCopy.shape[1])
+                imgSpectrum = sfft.rfft2(imgCopy, s=self.fftShape, axes=(0, 1), workers=self.workers)
+            self.forChunks(lambda filters: self.convolveFFT(imgSpectrum, out, filters), numFilters, FILTER_CHUNK)
+        elif self.mode == 'separable':
+            channels = [np.ascontiguousarray(imgCopy[:, :, c]) for c in range(imgCopy.shape[2])]
+            self.forChunks(lambda filters: self.convolveSeparable(channels, out, filters), numFilters, FILTER_CHUNK)
+        else:
+            self.forChunks(lambda filters: self.convolveReference(imgCopy, out, filters), numFilters, FILTER_CHUNK)
 
+    def convolveReference(self, imgCopy, out, filters):
         #convolve the image with kernels for each channel
-        for f in range(self.basis.shape[0]):
-            #TODO: replace with pyFFTW
-            self.aimTemp[:, :, f] = sig.fftconvolve(imgCopy[:, :, 0], self.basis[f, :, :, 0], mode='valid')
+        for f in range(filters.start, filters.stop):
+            out[:, :, f] = sig.fftconvolve(imgCopy[:, :, 0], self.basis[f, :, :, 0], mode='valid')
 
-            for c in range(1, self.img.shape[2]):
+            for c in range(1, imgCopy.shape[2]):
                 temp = sig.fftconvolve(imgCopy[:, :, c], self.basis[f, :, :, c], mode='valid')
-                self.aimTemp[:, :, f] += temp
+                out[:, :, f] += temp
 
-        maxAIM = np.amax(self.aimTemp)
-        minAIM = np.amin(self.aimTemp)
+    #split each kernel channel into separable rank-1 components (pairs of row and column kernels)
+    def decomposeBasis(self):
+        #sepFilter2D computes correlation, so the kernels are flipped back
+        kernels = np.moveaxis(self.basis[:, ::-1, ::-1, :], 3, 1)
+        U, S, Vt = np.linalg.svd(kernels)
+
+        if self.rank > 0:
+            ranks = np.full(S.shape[:2], min(self.rank, S.shape[2]))
+        else:
+            energy = np.cumsum(S*S, axis=2)/np.sum(S*S, axis=2, keepdims=True)
+            ranks = np.minimum(np.sum(energy < self.energy, axis=2) + 1, S.shape[2])
+
+        self.sepComponents = []
+        for f in range(kernels.shape[0]):
+            components = []
+            for c in range(kernels.shape[1]):
+                for i in range(ranks[f, c]):
+                    components.append((c, (Vt[f, c, i]*S[f, c, i]).astype(np.float32), U[f, c, :, i].astype(np.float32)))
+            self.sepComponents.append(components)
+
+        print('[AIM] separable basis with {:0.2f} components per kernel channel on average'.format(np.mean(ranks)))
+
+    def convolveSeparable(self, channels, out, filters):
+        #the kernel anchor is in its center, so the valid part starts half a kernel from the border
+        half = self.basis.shape[1]//2
+        h = out.shape[0]
+        w = out.shape[1]
+
+        for f in range(filters.start, filters.stop):
+            response = np.zeros((h, w), dtype=np.float32)
+            for c, kernelX, kernelY in self.sepComponents[f]:
+                response += cv2.sepFilter2D(channels[c], cv2.CV_32F, kernelX, kernelY)[half:half+h, half:half+w]
+            out[:, :, f] = response
+
+    def convolveFFT(self, imgSpectrum, out, filters):
+        #the sum over channels is done in the frequency domain, so only one inverse FFT per filter is needed
+        with self.getFFTBackend():
+            spectra = np.einsum('hwc,nhwc->nhw', imgSpectrum, self.basisSpectra[filters])
+            responses = sfft.irfft2(spectra, s=self.fftShape, axes=(1, 2), workers=self.workers)
+
+        #keep only the part computed without zero-padded borders (same as mode='valid')
+        kernelSize = self.basis.shape[1]
+        responses = responses[:, kernelSize-1:kernelSize-1+out.shape[0], kernelSize-1:kernelSize-1+out.shape[1]]
+        out[:, :, filters] = np.moveaxis(responses, 0, -1)
+
+    #rescale the feature maps using the global max and min and replace each response by its
+    #self-information -log(p) under the histogram of its feature map
+    #the rescaled responses are quantized to uint8 (aimTemp is stored as uint8 afterwards), all
+    #histograms are computed with one bincount, and -log(p) is looked up from a 256 entry table per filter
+    def computeSelfInformation(self):
+        minAIM, maxAIM = self.getExtrema(self.aimTemp)
 
         #print('[AIM] minAIM=' + str(minAIM), 'maxAIM=' + str(maxAIM))
 
-        #rescale image using global max and min
-        for f in range(self.basis.shape[0]):
-            self.aimTemp[:, :, f] -= minAIM
-            self.aimTemp[:, :, f] /= (maxAIM - minAIM)
+        self.normalizeResponses(self.aimTemp, minAIM, maxAIM)
+
+        hist = np.zeros((self.aimTemp.shape[2], NUM_BINS), dtype=np.int64)
+        self.accumulateHistograms(self.aimTemp, hist)
 
-        #compute histograms for each feature map
-        #and use them to rescale values based on histogram to reflect likelihood
-        div = 1/(self.aimTemp.shape[0]*self.aimTemp.shape[1])
+        self.aimTemp = self.quantizeResponses(self.aimTemp)
 
         self.sm = np.zeros((self.aimTemp.shape[0], self.aimTemp.shape[1]), dtype=np.float32)
+        self.addSelfInformation(self.sm, self.aimTemp, self.getLogTable(hist))
 
-        numBins = 256
-        for f in range(self.basis.shape[0]):
+    #convolves imgCopy in strips of tileRows rows of feature maps (with a halo of kernelSize-1 input rows)
+    #and yields the row range and the feature maps of each strip
+    def convolveStrips(self, imgCopy, tileRows):
+        kernelSize = self.basis.shape[1]
+        h = imgCopy.shape[0] - kernelSize + 1
+        w = imgCopy.shape[1] - kernelSize + 1
 
-            hist, bin_edges = np.histogram(self.aimTemp[:, :, f], bins=numBins, range=[0,1], density=False)
-            idx = self.aimTemp[:, :, f]*(numBins-1)
-            idx = idx.astype(int)
-            self.sm -= np.log(hist[idx]*div+0.000001)
+        #all strips have the same size (the last one overlaps the previous one) so that
+        #the kernel spectra are computed only once
+        tile = np.empty((min(tileRows, h), w, self.basis.shape[0]), dtype=np.float32)
+        for start in range(0, h, tileRows):
+            end = min(start + tileRows, h)
+            tileStart = max(0, end - tileRows)
+            self.convolve(imgCopy[tileStart:tileStart+tile.shape[0]+kernelSize-1], tile)
+            yield start, end, tile[start-tileStart:end-tileStart]
 
+    #same as computeSelfInformation, but the feature maps are computed and processed in strips of
+    #tileRows rows, so only the spill file holds all of them
+    def computeSelfInformationTiled(self, imgCopy, tileRows):
+        kernelSize = self.basis.shape[1]
+        h = imgCopy.shape[0] - kernelSize + 1
+        w = imgCopy.shape[1] - kernelSize + 1
+        numFilters = self.basis.shape[0]
 
-        cv2.normalize(self.sm, self.sm, 0, 1, cv2.NORM_MINMAX)
-        self.sm = cv2.GaussianBlur(self.sm,(31, 31), 8, cv2.BORDER_CONSTANT)
-        self.sm = cv2.copyMakeBorder(self.sm, border, border, border, border, cv2.BORDER_CONSTANT, 0)
-        self.sm = cv2.resize(self.sm, (self.origW, self.origH), 0, 0, cv2.INTER_AREA)
+        with tempfile.TemporaryFile(dir=self.spillDir) as spillFile:
+            spill = np.memmap(spillFile, dtype=np.float32, mode='w+', shape=(h, w, numFilters))
+
+            #1st pass: feature maps and their global min and max
+            minAIM = None
+            maxAIM = None
+            for start, end, tile in self.convolveStrips(imgCopy, tileRows):
+                tileMin, tileMax = self.getExtrema(tile)
+                minAIM = tileMin if minAIM is None else min(minAIM, tileMin)
+                maxAIM = tileMax if maxAIM is None else max(maxAIM, tileMax)
+                spill[start:end] = tile
+
+            self.computeSelfInformationStreamed(spill, tileRows, minAIM, maxAIM)
+            del spill
+
+    #same as computeSelfInformation for feature maps which are not kept in memory (the spill file of
+    #the tiled mode or a crop of the scene feature maps), which are read in strips of tileRows rows
+    def computeSelfInformationStreamed(self, responses, tileRows, minAIM=None, maxAIM=None):
+        h = responses.shape[0]
+        strips = [slice(start, min(start + tileRows, h)) for start in range(0, h, tileRows)]
+
+        if minAIM is None:
+            extrema = [self.getExtrema(np.asarray(responses[rows])) for rows in strips]
+            minAIM = min(e[0] for e in extrema)
+            maxAIM = max(e[1] for e in extrema)
+
+        #histograms of the rescaled feature maps
+        hist = np.zeros((responses.shape[2], NUM_BINS), dtype=np.int64)
+        for rows in strips:
+            tile = np.array(responses[rows])
+            self.normalizeResponses(tile, minAIM, maxAIM)
+            self.accumulateHistograms(tile, hist)
+
+        #self-information
+        logTable = self.getLogTable(hist)
+        self.sm = np.zeros((h, responses.shape[1]), dtype=np.float32)
+        for rows in strips:
+            tile = np.array(responses[rows])
+            self.normalizeResponses(tile, minAIM, maxAIM)
+            self.addSelfInformation(self.sm[rows], self.quantizeResponses(tile), logTable)
+
+        self.aimTemp = None
+
+    #number of rows of feature maps that can be processed at once within memoryBudget
+    #(the whole image if there is no budget)
+    def getTileRows(self, imgH, imgW):
+        kernelSize = self.basis.shape[1]
+        h = imgH - kernelSize + 1
+        w = imgW - kernelSize + 1
+        if self.memoryBudget <= 0:
+            return h
+
+        numFilters = self.basis.shape[0]
+        if self.mode == 'fft':
+            #kernel spectra, their product with the image spectrum (complex64) and the inverse FFT (float32)
+            fftW = sfft.next_fast_len(imgW + kernelSize - 1, real=True)
+            rowBytes = numFilters*((fftW//2 + 1)*8*2 + fftW*4)
+        else:
+            rowBytes = numFilters*w*4
+        #the strip of feature maps and the bins built from it
+        rowBytes += numFilters*w*(4 + 4 + 8)
+
+        #the image and the saliency map are needed in any case
+        fixedBytes = imgH*imgW*3*4*2 + h*w*4
 
+        #strips shorter than the halo would mostly recompute the halo, so this is the minimum even
+        #if the budget is smaller
+        tileRows = (int(self.memoryBudget*1024*1024) - fixedBytes)//rowBytes - (kernelSize - 1)
+        return min(max(tileRows, kernelSize - 1), h)
+
+    #global min and max of the responses (reduced from the chunks, the result does not depend on the order)
+    def getExtrema(self, responses):
+        extrema = self.forChunks(lambda rows: (np.amin(responses[rows]), np.amax(responses[rows])), responses.shape[0], ROW_CHUNK)
+        return min(e[0] for e in extrema), max(e[1] for e in extrema)
+
+    def normalizeResponses(self, responses, minAIM, maxAIM):
+        def normalize(rows):
+            responses[rows] -= minAIM
+            responses[rows] /= (maxAIM - minAIM)
+        self.forChunks(normalize, responses.shape[0], ROW_CHUNK)
+
+    #same bins as np.histogram(..., bins=256, range=[0,1]), the value 1 falls into the last bin
+    #each filter gets its own range of bins, so a single bincount computes all histograms of a chunk
+    #(counts are integers, so adding them up does not depend on the order)
+    def accumulateHistograms(self, responses, hist):
+        numFilters = responses.shape[2]
+        def count(rows):
+            bins = responses[rows]*np.float32(NUM_BINS)
+            np.minimum(bins, NUM_BINS-1, out=bins)
+            bins = bins.astype(np.min_scalar_type(numFilters*NUM_BINS))
+            bins += (np.arange(numFilters)*NUM_BINS).astype(bins.dtype)
+            return np.bincount(bins.ravel(), minlength=numFilters*NUM_BINS)
+        for counts in self.forChunks(count, responses.shape[0], ROW_CHUNK):
+            hist += counts.reshape(numFilters, NUM_BINS)
+
+    #the histograms are looked up with the responses quantized to NUM_BINS-1 levels (as in the original AIM)
+    def quantizeResponses(self, responses):
+        idx = np.empty(responses.shape, dtype=np.uint8)
+        def quantize(rows):
+            idx[rows] = responses[rows]*np.float32(NUM_BINS-1)
+        self.forChunks(quantize, responses.shape[0], ROW_CHUNK)
+        return idx
+
+    def getLogTable(self, hist):
+        #every histogram counts all pixels of the feature map
+        div = 1/int(hist[0].sum())
+        return np.log(hist*div+0.000001)
+
+    #the filters are added up in the same order for every pixel, so the rows can be split between threads
+    def addSelfInformation(self, sm, idx, logTable):
+        def add(rows):
+            for f in range(idx.shape[2]):
+                sm[rows] -= logTable[f][idx[rows, :, f]]
+        self.forChunks(add, idx.shape[0], ROW_CHUNK)
+
+    def computeSaliency(self):
+        imgCopy = self.img.copy()
+
+        #AIM kernels are ordered for RGB channels
+        #so convert the image from BGR to RGB
+        imgCopy = imgCopy[...,::-1]
+        #t0 = time.time()
+
+        tileRows = self.getTileRows(imgCopy.shape[0], imgCopy.shape[1])
+        if tileRows < imgCopy.shape[0] - self.basis.shape[1] + 1:
+            self.computeSelfInformationTiled(imgCopy, tileRows)
+        else:
+            self.aimTemp = np.empty((imgCopy.shape[0]-self.basis.shape[1]+1, imgCopy.shape[1]-self.basis.shape[1]+1, self.basis.shape[0]), dtype=np.float32)
+            self.convolve(imgCopy, self.aimTemp)
+            self.computeSelfInformation()
 
         #t1 = time.time()
         #print('[AIM] Time elapsed {:1.03f}'.format(t1-t0))
@@ -102,4 +427,161 @@ class AIM:
         #cv2.waitKey(0)
         #cv2.destroyAllWindows()
 
+        return self.postprocessSaliency()
+
+    def postprocessSaliency(self):
+        border = round(self.basis.shape[1]/2)
+
+        cv2.normalize(self.sm, self.sm, 0, 1, cv2.NORM_MINMAX)
+        self.sm = cv2.GaussianBlur(self.sm,(31, 31), 8, cv2.BORDER_CONSTANT)
+        self.sm = cv2.copyMakeBorder(self.sm, border, border, border, border, cv2.BORDER_CONSTANT, 0)
+        self.sm = cv2.resize(self.sm, (self.origW, self.origH), 0, 0, cv2.INTER_AREA)
+
         return self.sm
+
+    #compute the feature maps once for the whole scene, every view of size viewH x viewW cropped
+    #from it is then processed with computeSaliencyAt() without any convolutions
+    #only the valid part of the convolutions is used, so the feature maps of a crop depend only on
+    #the pixels of the view. If the view is resized to newW x newH by averaging blocks of k x k pixels
+    #(viewW = k*newW and viewH = k*newH), resizing commutes with cropping, and the feature maps of the
+    #scene are computed (when first needed) for each offset of the view relative to the blocks. The
+    #result is then the same as computeSaliency() on the view up to float rounding.
+    #For other view sizes the resized views cannot be cropped from a resized scene, so the scene is not
+    #used and False is returned (the views must be processed with loadImage() and computeSaliency())
+    def setScene(self, scene, viewH, viewW):
+        self.scene = None
+        self.sceneResponses = {}
+        self.sceneFiles = []
+
+        k = viewW//self.newW
+        newH = int(viewH*(self.newW/viewW))
+        if k == 0 or viewW != k*self.newW or viewH != k*newH:
+            return False
+
+        self.origH = viewH
+        self.origW = viewW
+        self.newH = newH
+
+        self.scene = scene
+        self.sceneBlock = k
+        return True
+
+    #feature maps of the scene shifted by phase=(rows, cols) pixels
+    def getSceneResponses(self, phase):
+        if phase in self.sceneResponses:
+            return self.sceneResponses[phase]
+
+        kernelSize = self.basis.shape[1]
+
+        k = self.sceneBlock
+        sceneImg = self.scene[phase[0]:, phase[1]:].astype(np.float32)
+        sceneImg = sceneImg[:sceneImg.shape[0]//k*k, :sceneImg.shape[1]//k*k]
+        sceneImg = cv2.resize(sceneImg, (sceneImg.shape[1]//k, sceneImg.shape[0]//k), interpolation=cv2.INTER_AREA)
+        sceneImg = sceneImg[...,::-1]
+
+        shape = (sceneImg.shape[0] - kernelSize + 1, sceneImg.shape[1] - kernelSize + 1, self.basis.shape[0])
+        if self.memoryBudget > 0:
+            sceneFile = tempfile.TemporaryFile(dir=self.spillDir)
+            self.sceneFiles.append(sceneFile)
+            responses = np.memmap(sceneFile, dtype=np.float32, mode='w+', shape=shape)
+        else:
+            responses = np.empty(shape, dtype=np.float32)
+
+        #strips are at most as high as a view, so the FFTs are not larger than for a single view
+        tileRows = min(self.getTileRows(sceneImg.shape[0], sceneImg.shape[1]), self.newH - kernelSize + 1)
+        for start, end, tile in self.convolveStrips(sceneImg, tileRows):
+            responses[start:end] = tile
+
+        self.sceneResponses[phase] = responses
+        return responses
+
+    #saliency of the view at gazeCoords (top-left corner of the view in the scene passed to setScene)
+    def computeSaliencyAt(self, gazeCoords):
+        kernelSize = self.basis.shape[1]
+        h = self.newH - kernelSize + 1
+        w = self.newW - kernelSize + 1
+
+        k = self.sceneBlock
+        sceneResponses = self.getSceneResponses((int(gazeCoords[0]) % k, int(gazeCoords[1]) % k))
+        top = int(gazeCoords[0])//k
+        left = int(gazeCoords[1])//k
+
+        top = min(max(top, 0), sceneResponses.shape[0] - h)
+        left = min(max(left, 0), sceneResponses.shape[1] - w)
+        responses = sceneResponses[top:top+h, left:left+w]
+
+        tileRows = self.getTileRows(self.newH, self.newW)
+        if tileRows < h:
+            self.computeSelfInformationStreamed(responses, tileRows)
+        else:
+            self.aimTemp = np.array(responses)
+            self.computeSelfInformation()
+
+        return self.postprocessSaliency()
+
+
+#compare the saliency maps of the separable mode against the exact fft mode on a set of images
+def reportSeparableError(basisMatPath, imgPaths, rank, energy):
+    exact = AIM(basisMatPath, 'fft')
+    approx = AIM(basisMatPath, 'separable', rank=rank, energy=energy)
+
+    for imgPath in imgPaths:
+        img = cv2.imread(imgPath)
+        if img is None:
+            continue
+
+        times = []
+        maps = []
+        for aim in [exact, approx]:
+            #the first call also computes the kernel spectra, so time the second one
+            aim.loadImage(img)
+            aim.computeSaliency()
+            t0 = time.time()
+            aim.loadImage(img)
+            maps.append(aim.computeSaliency())
+            times.append(time.time()-t0)
+
+        diff = np.abs(maps[0]-maps[1])
+        cc = np.corrcoef(maps[0].ravel(), maps[1].ravel())[0, 1]
+        print('[AIM] {}: max abs error {:0.4f}, mean {:0.5f}, CC {:0.4f}, time fft {:0.3f}s separable {:0.3f}s'.format(
+            os.path.basename(imgPath), diff.max(), diff.mean(), cc, times[0], times[1]))
+
+
+# run as
+# python3 src/AIM.py --compile-basis <basis.mat> [<basis.mat> ...]
+# e.g.
+# python3 src/AIM.py --compile-basis data/21infomax900.mat data/21infomax950.mat
+# or
+# python3 src/AIM.py --separable-error [--rank R] [--energy E] <basis.mat> <img_path or dir>
+# e.g.
+# python3 src/AIM.py --separable-error --rank 2 data/21infomax950.mat images/
+if __name__ == '__main__':
+    import sys
+    import getopt
+
+    def usage():
+        print('Usage: python3 AIM.py --compile-basis <basis.mat> [<basis.mat> ...]')
+        print('       python3 AIM.py --separable-error [--rank R] [--energy E] <basis.mat> <img_path or dir>')
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['help', 'compile-basis', 'separable-error', 'rank=', 'energy='])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    opts = dict(opts)
+
+    if '--compile-basis' in opts and args:
+        for basisMatPath in args:
+            print('[AIM] Compiled {} to {}'.format(basisMatPath, compileBasis(basisMatPath)))
+    elif '--separable-error' in opts and len(args) == 2:
+        imgPath = args[1]
+        if os.path.isdir(imgPath):
+            imgPaths = [os.path.join(imgPath, f) for f in sorted(os.listdir(imgPath))]
+        else:
+            imgPaths = [imgPath]
+        reportSeparableError(args[0], imgPaths, int(opts.get('--rank', 0)), float(opts.get('--energy', 0.99)))
+    else:
+        usage()
+        sys.exit(2)
@@ -4,6 +4,9 @@ import math
 import cv2
 from PIL import Image
 
+from SaliencyCache import getSaliencyCache, getModelId, computeCached
+from Geometry import getDiskMask
+
 class CentralAttentionalMap:
     def __init__(self, h, w, settings):
         self.height = h
@@ -11,52 +14,198 @@ class CentralAttentionalMap:
         self.settings = settings
         self.centralMask = None
         self.centralMap = None
+        self.roi = None
         self.cv2pil = False
+        self.modelName = None
+        self.cache = getSaliencyCache(settings.saliencyCacheDir, int(settings.saliencyCacheSizeMB*2**20))
         if 'DeepGazeII' in settings.CentralSalAlgorithm:
-            from DeepGazeII import DeepGazeII
-            self.buSal = DeepGazeII()
+            #loaded on first use, see ModelRegistry
+            self.modelName = 'DeepGazeII'
         elif 'SALICONtf' in settings.CentralSalAlgorithm:
             from SALICONtf import SALICONtf
-            self.buSal = SALICONtf(weights='contrib/SALICONtf/models/model_lr0.01_loss_crossentropy.h5')
+            self.salModel = SALICONtf(weights='contrib/SALICONtf/models/model_lr0.01_loss_crossentropy.h5')
             self.cv2pil = True
         self.initCentralMask()
 
+    @property
+    def buSal(self):
+        if self.modelName is not None:
+            from ModelRegistry import getModel
+            return getModel(self.modelName, self.settings)
+        return self.salModel
+
     def update(self, h, w, settings):
         self.height = h
         self.width = w
         self.settings = settings
         self.centralMask = None
         self.centralMap = None
+        self.roi = None
         self.initCentralMask()        
 
     def initCentralMask(self):
-        self.centralMask = np.zeros((self.height,self.width), np.uint8)
         centX = round(self.height/2)
         centY = round(self.width/2)
 
         self.settings.cSizePix = self.settings.cSizeDeg*self.settings.pix2deg
 
-        for i in range(self.height):
-            for j in range(self.width):
-                rad = math.sqrt((i-centX)*(i-centX) + (j-centY)*(j-centY))
-                if (rad <= self.settings.cSizePix):
-                    self.centralMask[i, j] = 1
-                else:
-                    self.centralMask[i, j] = 0
+        #1 within cSizePix of the center
+        self.centralMask = getDiskMask(self.height, self.width, centX, centY, self.settings.cSizePix)
+
+        #bounding box of the central field with a margin for the receptive field of the model
+        #(the model is only run on this region if centralROI is on)
+        margin = round(self.settings.centralROIMarginDeg*self.settings.pix2deg)
+        rad = self.settings.cSizePix
+        self.roi = (max(0, math.ceil(centX - rad) - margin), min(self.height, math.floor(centX + rad) + 1 + margin),
+                    max(0, math.ceil(centY - rad) - margin), min(self.width, math.floor(centY + rad) + 1 + margin))
+
+    #crop of the view the model is run on
+    def getROI(self, view):
+        if not self.settings.centralROI:
+            return view
+        top, bottom, left, right = self.roi
+        return view[top:bottom, left:right]
 
+    #paste the map computed on the crop into the map of the whole view
+    #only the central field is kept by maskCentralDetection, so the rest is left at 0
+    def pasteROI(self, roiMap):
+        if not self.settings.centralROI:
+            return roiMap
+        top, bottom, left, right = self.roi
+        centralMap = np.zeros((self.height, self.width), dtype=roiMap.dtype)
+        centralMap[top:bottom, left:right] = roiMap
+        return centralMap
+
+
+    def getCacheKey(self, view):
+        return self.cache.getKey(view, getModelId(self.settings.CentralSalAlgorithm, self.settings))
 
     def centralDetection(self, view):
-        
+        view = self.getROI(view)
+
+        key = None
+        if self.cache is not None:
+            key = self.getCacheKey(view)
+            self.centralMap = self.cache.get(key)
+            if self.centralMap is not None:
+                self.centralMap = self.pasteROI(self.centralMap)
+                return
+
         if self.cv2pil:
             view_img = Image.fromarray((view[:, :, ::-1]*255).astype(np.uint8)) #convert image from cv2 to PIL format
         else:
             view_img = view*255
         #SALICON works on images with range [0, 255]
-        self.centralMap = self.buSal.compute_saliency(img=view_img)
+        if self.cv2pil:
+            self.centralMap = self.buSal.compute_saliency(img=view_img)
+        else:
+            self.centralMap = self.buSal.compute_saliency(img=view_img, scale=self.settings.centralInferenceScale)
         cv2.normalize(self.centralMap, self.centralMap, 0, 1, cv2.NORM_MINMAX)
+        if key is not None:
+            self.centralMap = self.cache.put(key, self.centralMap)
+        self.centralMap = self.pasteROI(self.centralMap)
+
+    #same as centralDetection for a list of views (e.g. of several subjects or images), returns the list
+    #of maps. The views are run in batches if the model supports it (see ShapeBuckets)
+    def centralDetectionBatch(self, views):
+        if self.cv2pil or not hasattr(self.buSal, 'compute_saliency_batch'):
+            centralMaps = []
+            for view in views:
+                self.centralDetection(view)
+                centralMaps.append(self.centralMap)
+            return centralMaps
+
+        def computeBatch(views):
+            #the models work on images with range [0, 255]
+            centralMaps = self.buSal.compute_saliency_batch([view*255 for view in views], self.settings.centralInferenceScale)
+            for centralMap in centralMaps:
+                cv2.normalize(centralMap, centralMap, 0, 1, cv2.NORM_MINMAX)
+            return centralMaps
+
+        #views found in the cache are not run, duplicate views are run once
+        views = [self.getROI(view) for view in views]
+        centralMaps = computeCached(self.cache, getModelId(self.settings.CentralSalAlgorithm, self.settings), views, computeBatch)
+        return [self.pasteROI(centralMap) for centralMap in centralMaps]
 
     def maskCentralDetection(self):
         self.centralMap[self.centralMask == 0] = 0
         # cv2.imshow('image',self.centralMap)
         # cv2.waitKey(0)
         # cv2.destroyAllWindows()
+
+
+#compare DeepGazeII run at several centralInferenceScale values against scale 1: time per view and
+#correlation of the central maps (on the first view of every image), and distance of the fixations
+def benchmarkInferenceScale(iniPath, scales):
+    from Settings import Settings
+    from Controller import Controller, compareFixationLists
+
+    settings = Settings(iniPath, False)
+    #maps from the cache would distort the times
+    settings.saliencyCacheDir = None
+    scales = [1.0] + sorted([scale for scale in scales if scale != 1], reverse=True)
+
+    controller = Controller(settings)
+    controller.getInputImages()
+
+    times = {scale: 0 for scale in scales}
+    ccs = {scale: [] for scale in scales}
+    for i, imgPath in enumerate(controller.imageList):
+        controller.setup(imgPath)
+        controller.eye.viewScene()
+        view = controller.eye.viewFov
+
+        reference = None
+        for scale in scales:
+            settings.centralInferenceScale = scale
+            #the first run of every shape includes the setup of the model
+            if i == 0:
+                controller.centralMap.centralDetection(view)
+
+            t0 = time.time()
+            controller.centralMap.centralDetection(view)
+            times[scale] += time.time() - t0
+
+            centralMap = controller.centralMap.centralMap
+            if reference is None:
+                reference = centralMap.copy()
+            ccs[scale].append(np.corrcoef(reference.ravel(), centralMap.ravel())[0, 1])
+
+    fixations = {}
+    for scale in scales:
+        settings.centralInferenceScale = scale
+        fixations[scale] = Controller(settings).computeFixationLists()
+
+    numImages = max(1, len(controller.imageList))
+    for scale in scales:
+        dist = compareFixationLists(fixations[1.0], fixations[scale], '[CentralAttentionalMap] scale {}'.format(scale))
+        print('[CentralAttentionalMap] scale {}: {:0.03f}s per view, central map CC {:0.4f}, fixation distance mean {:0.03f} deg, {:0.01f}% of fixations more than 1 deg apart'.format(
+            scale, times[scale]/numImages, np.mean(ccs[scale]), dist.mean() if len(dist) else 0, 100*np.mean(dist > 1) if len(dist) else 0))
+
+
+# run as
+# python3 src/CentralAttentionalMap.py --benchmark [--scales <scale>,<scale>,...] <config.ini>
+# e.g.
+# python3 src/CentralAttentionalMap.py --benchmark --scales 0.75,0.5,0.35,0.25 config_files/test.ini
+if __name__ == '__main__':
+    import getopt
+    import sys
+
+    def usage():
+        print('Usage: python3 CentralAttentionalMap.py --benchmark [--scales <scale>,<scale>,...] <config.ini>')
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['help', 'benchmark', 'scales='])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    opts = dict(opts)
+
+    if '--benchmark' in opts and len(args) == 1:
+        scales = [float(scale) for scale in opts.get('--scales', '0.75,0.5,0.35,0.25').split(',')]
+        benchmarkInferenceScale(args[0], scales)
+    else:
+        usage()
+        sys.exit(2)
@@ -1,7 +1,11 @@
 from os import listdir
 import os
+import copy
+import multiprocessing
+import traceback
 import numpy as np
 import cv2
+from PIL import Image
 
 import time
 
@@ -32,7 +36,10 @@ class Controller:
         self.priorityMap=None
         self.fixHistMap=None
 
-        self.model_setup_done = False
+        #image size and pix2deg the maps were built for
+        self.mapsKey = None
+        #no subject has viewed the current image yet
+        self.newImage = False
 
         #save results
         self.saveResults = False
@@ -52,45 +59,172 @@ class Controller:
             #list all images in the directory
             self.imageList = [f for f in listdir(self.settings.batch) if any(f.endswith(ext) for ext in ['jpg', 'bmp', 'png', 'gif']) ]
 
+            #images of the same size follow each other, so the saliency models see the same input shapes
+            if self.settings.sortBatchBySize:
+                self.imageList.sort(key=lambda f: self.getImageSize(self.settings.batch + '/' + f))
 
-    def setup(self, imgPath):
+    #(height, width) of an image, read only from the file header
+    def getImageSize(self, imgPath):
+        with Image.open(imgPath) as img:
+            return img.size[::-1]
+
+
+    #load a new image, followed by resetSubject() for every subject
+    #the environment, eye (with the foveation state) and maps are created once and kept across images and
+    #subjects, the masks and buffers are only rebuilt when the image size (or pix2deg) changes
+    def reset(self, imgPath):
         imgName, ext = os.path.splitext(os.path.basename(imgPath))
         self.imgName = imgName
-        self.env = Environment(self.settings)
-        if self.settings.batch:
-            self.env.loadStaticStimulus(self.settings.batch + '/' + imgPath)
+        if self.env is None:
+            self.env = Environment(self.settings)
+        self.env.loadStaticStimulus(self.getImagePath(imgPath))
+
+        if self.eye is None:
+            self.eye = Eye(self.settings, self.env)
+
+        self.updateMaps()
+
+        #without foveation every view is a crop of the padded scene
+        if self.settings.AIMSceneCache:
+            self.periphMap.setScene(self.env.scenePadded)
+
+        self.newImage = True
+
+    #start a new subject on the current image
+    #subject - index of the subject, seeds the random fixation selection (see PriorityMap.seedRandom)
+    def resetSubject(self, subject=0):
+        if not self.newImage:
+            self.env.reset()
+            self.updateMaps()
+        self.newImage = False
+
+        self.eye.reset()
+
+        h, w = self.env.height, self.env.width
+        if self.priorityMap is None:
+            self.conspMap = ConspicuityMap(h, w, self.settings)
+            self.priorityMap = PriorityMap(h, w, self.settings)
+            self.fixHistMap = FixationHistoryMap(h, w, self.env.hPadded, self.env.wPadded, self.settings)
         else:
-            self.env.loadStaticStimulus(imgPath)
-        self.eye = Eye(self.settings, self.env)
+            if (self.conspMap.height, self.conspMap.width) != (h, w):
+                self.conspMap = ConspicuityMap(h, w, self.settings)
+            self.priorityMap.reset(h, w)
+            self.fixHistMap.reset(h, w, self.env.hPadded, self.env.wPadded)
+        self.priorityMap.seedRandom('{}/{}'.format(self.imgName, subject))
 
-        if not self.model_setup_done:
+    def updateMaps(self):
+        mapsKey = (self.env.height, self.env.width, self.settings.pix2deg)
+        if self.periphMap is None:
             self.periphMap = PeripheralAttentionalMap(self.env.height, self.env.width, self.settings)
             self.centralMap = CentralAttentionalMap(self.env.height, self.env.width, self.settings)
-            self.model_setup_done = True
-        else:
+        elif mapsKey != self.mapsKey:
             self.periphMap.update(self.env.height, self.env.width, self.settings)
             self.centralMap.update(self.env.height, self.env.width, self.settings)
+        self.mapsKey = mapsKey
 
+    def getImagePath(self, imgPath):
+        if self.settings.batch:
+            return self.settings.batch + '/' + imgPath
+        return imgPath
 
-        self.conspMap = ConspicuityMap(self.env.height, self.env.width, self.settings)
-        self.priorityMap = PriorityMap(self.env.height, self.env.width, self.settings)
-        self.fixHistMap = FixationHistoryMap(self.env.height, self.env.width, self.env.hPadded, self.env.wPadded, self.settings)
+    def setup(self, imgPath):
+        self.reset(imgPath)
+        self.resetSubject()
 
     #computes fixations for each image and each subject
     def run(self):
         self.getInputImages()
         for imgPath in self.imageList:
+            self.processImage(imgPath)
+
+    #same as run() with the images distributed over numWorkers processes, returns the list of images that
+    #failed. Progress and failures are reported for every image.
+    def runWorkers(self, numWorkers):
+        global workerState
+
+        self.getInputImages()
+        if not self.imageList:
+            return []
+
+        #split the cores between the workers
+        threads = max(1, (os.cpu_count() or 1) // numWorkers)
+        self.settings.numCores = threads
+        if not self.settings.tfIntraOpThreads:
+            self.settings.tfIntraOpThreads = threads
+        if not self.settings.tfInterOpThreads:
+            self.settings.tfInterOpThreads = 1
+        self.settings.aimThreads = min(self.settings.aimThreads, threads)
 
-            for i in range(self.settings.numSubjects):
-                self.setup(imgPath)
+        #loading an image sets paddingRGB, inputSizeDeg and pix2deg in the settings, so in the serial run
+        #the first image sees the settings from the .ini file and every other image sees them as set by the
+        #first one. The workers start with the latter and restore the former for the first image.
+        initialSettings = copy.deepcopy(vars(self.settings))
+        self.preload(self.imageList[0])
+        workerState = (self, initialSettings, threads)
+
+        failed = []
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(numWorkers, initializer=initWorker) as pool:
+            for n, (imgPath, error, elapsed) in enumerate(pool.imap_unordered(runWorkerTask, enumerate(self.imageList)), 1):
+                if error:
+                    failed.append(imgPath)
+                    print('[Batch] {}/{} {} FAILED after {:0.01f}s\n{}'.format(n, len(self.imageList), imgPath, elapsed, error))
+                else:
+                    print('[Batch] {}/{} {} done in {:0.01f}s'.format(n, len(self.imageList), imgPath, elapsed))
+
+        print('[Batch] {} images done, {} failed'.format(len(self.imageList) - len(failed), len(failed)))
+        return failed
+
+    #load the environment and maps before the workers are forked, so that their read-only data (e.g. the
+    #AIM basis) is shared copy-on-write. The eye (CUDA context of Foveate) and the CNN models (TensorFlow
+    #and ONNX Runtime sessions are not fork-safe) are created by every worker on first use.
+    def preload(self, imgPath):
+        self.env = Environment(self.settings)
+        self.env.loadStaticStimulus(self.getImagePath(imgPath))
+        self.updateMaps()
+
+    #computes (and saves) the fixations of every subject for one image
+    #groups of subjects are run in lockstep if a CNN model is used, see computeFixationsBatch
+    def processImage(self, imgPath):
+        self.reset(imgPath)
+
+        groupSize = self.getSubjectGroupSize()
+        for first in range(0, self.settings.numSubjects, groupSize):
+            subjects = range(first, min(first + groupSize, self.settings.numSubjects))
+            if len(subjects) == 1:
+                self.resetSubject(first)
                 self.computeFixations()
+                self.saveSubject(first)
+            else:
+                self.computeFixationsBatch(subjects)
+
+    #number of subjects run in lockstep: up to inferenceBatchSize when DeepGazeII or ICF is used (the other
+    #models gain nothing from batching), 1 with visualization
+    def getSubjectGroupSize(self):
+        if self.settings.visualize:
+            return 1
+        if 'DeepGazeII' not in self.settings.CentralSalAlgorithm and 'ICF' not in self.settings.PeriphSalAlgorithm:
+            return 1
+        return max(1, self.settings.inferenceBatchSize)
+
+    def saveSubject(self, subject):
+        if self.saveResults:
+            currentSaveDir = '{}/{}/'.format(self.settings.saveDir, self.imgName)
+            #workers may create it concurrently
+            os.makedirs(currentSaveDir, exist_ok=True)
+            self.fixHistMap.dumpFixationsToMat('{}/fixations_{}.mat'.format(currentSaveDir, self.imgName, subject))
+            cv2.imwrite('{}/fixations_{}.png'.format(currentSaveDir, self.imgName), self.env.sceneWithFixations.astype(np.uint8))
 
-                if self.saveResults:
-                    currentSaveDir = '{}/{}/'.format(self.settings.saveDir, self.imgName)
-                    if not os.path.exists(currentSaveDir):
-                        os.makedirs(currentSaveDir)
-                    self.fixHistMap.dumpFixationsToMat('{}/fixations_{}.mat'.format(currentSaveDir, self.imgName, i))
-                    cv2.imwrite('{}/fixations_{}.png'.format(currentSaveDir, self.imgName), self.env.sceneWithFixations.astype(np.uint8))
+    #fixations of one subject for each input image (not saved), with pix2deg of the image
+    #used by the reports comparing model settings (see compareFixationLists)
+    def computeFixationLists(self):
+        self.getInputImages()
+        fixationLists = {}
+        for imgPath in self.imageList:
+            self.setup(imgPath)
+            self.computeFixations()
+            fixationLists[imgPath] = (self.fixHistMap.fixationList.copy(), self.settings.pix2deg)
+        return fixationLists
 
     def computeFixations(self):
 
@@ -104,7 +238,10 @@ class Controller:
             prevGazeCoords = self.eye.gazeCoords.copy()
 
             t0 = time.time()
-            self.periphMap.computeBUSaliency(self.eye.viewFov)
+            if self.settings.AIMSceneCache:
+                self.periphMap.computeBUSaliency(self.eye.viewFov, self.eye.gazeCoords)
+            else:
+                self.periphMap.computeBUSaliency(self.eye.viewFov)
             self.periphMap.computePeriphMap(self.settings.blendingStrategy==1)
             t_periph = time.time() - t0
             print('[PeriphMap] Time elapsed {:0.03f}'.format(t_periph))
@@ -117,25 +254,7 @@ class Controller:
 
             #self.conspMap.computeConspicuityMap(self.periphMap.periphMap, self.centralMap.centralMap) #this is not used anywhere, for now commenting out
 
-            t0 = time.time()
-            self.fixHistMap.saveFixationCoords(prevGazeCoords)
-            t_save = time.time() - t0
-            print('[SaveFix] Time elapsed {:0.03f}'.format(t_save))
-
-            t0 = time.time()
-            self.priorityMap.computeNextFixationDirection(self.periphMap.periphMap, self.centralMap.centralMap, self.fixHistMap.getFixationHistoryMap())
-            t_priority = time.time() - t0
-            print('[PriorityMap] Time elapsed {:0.03f}'.format(t_priority))
-
-            print('PrevGazeCoords=[{}, {}]'.format(prevGazeCoords[0], prevGazeCoords[1]))
-            self.eye.setGazeCoords(self.priorityMap.nextFixationDirection)
-
-            self.env.drawFixation(self.eye.gazeCoords.astype(np.int32), prevGazeCoords)
-
-            t0 = time.time()
-            self.fixHistMap.decayFixations()
-            t_ior = time.time() - t0
-            print('[IOR] Time elapsed {:0.03f}'.format(t_ior))
+            self.selectNextFixation(prevGazeCoords)
 
             if self.settings.visualize:
                 t0 = time.time()
@@ -159,6 +278,77 @@ class Controller:
                 print('[vis] Time elapsed {:0.03f}'.format(t_vis))
                 plt.pause(0.01)
 
+    #same as computeFixations for several subjects of the current image at once: at every fixation the
+    #views of all subjects are computed first, and the saliency models are run on them in one batch
+    #(identical views, e.g. the first views, are run once). Every subject has its own maps, fixation history
+    #and random generator, so the fixations are the same as when the subjects are run one by one.
+    def computeFixationsBatch(self, subjects):
+        states = []
+        for subject in subjects:
+            self.resetSubject(subject)
+            states.append(SubjectState(self))
+            #the next subject gets new maps
+            self.priorityMap = None
+
+        for i in range(self.settings.maxNumFixations):
+            t0 = time.time()
+            views = []
+            gazeCoords = []
+            for state in states:
+                state.load(self)
+                self.eye.viewScene()
+                state.store(self)
+                #the foveated view may be overwritten by the next one
+                views.append(self.eye.viewFov.copy())
+                gazeCoords.append(self.eye.gazeCoords.copy())
+            t_fov = time.time() - t0
+            print('[FOVEATE] Time elapsed {:0.03f}'.format(t_fov))
+
+            t0 = time.time()
+            salMaps = self.periphMap.computeBUSaliencyBatch(views, gazeCoords if self.settings.AIMSceneCache else None)
+            t_periph = time.time() - t0
+            print('[PeriphMap] Time elapsed {:0.03f}'.format(t_periph))
+
+            t0 = time.time()
+            centralMaps = self.centralMap.centralDetectionBatch(views)
+            t_central = time.time() - t0
+            print('[CentralMap] Time elapsed {:0.03f}'.format(t_central))
+
+            for state, prevGazeCoords, salMap, centralMap in zip(states, gazeCoords, salMaps, centralMaps):
+                state.load(self)
+                self.periphMap.salMap = salMap
+                self.periphMap.computePeriphMap(self.settings.blendingStrategy==1)
+                self.centralMap.centralMap = centralMap
+                self.centralMap.maskCentralDetection()
+                self.selectNextFixation(prevGazeCoords)
+                state.store(self)
+
+        for subject, state in zip(subjects, states):
+            state.load(self)
+            self.saveSubject(subject)
+
+    #add the current fixation to the history, choose the next one and move the eye
+    def selectNextFixation(self, prevGazeCoords):
+        t0 = time.time()
+        self.fixHistMap.saveFixationCoords(prevGazeCoords)
+        t_save = time.time() - t0
+        print('[SaveFix] Time elapsed {:0.03f}'.format(t_save))
+
+        t0 = time.time()
+        self.priorityMap.computeNextFixationDirection(self.periphMap.periphMap, self.centralMap.centralMap, self.fixHistMap.getFixationHistoryMap())
+        t_priority = time.time() - t0
+        print('[PriorityMap] Time elapsed {:0.03f}'.format(t_priority))
+
+        print('PrevGazeCoords=[{}, {}]'.format(prevGazeCoords[0], prevGazeCoords[1]))
+        self.eye.setGazeCoords(self.priorityMap.nextFixationDirection)
+
+        self.env.drawFixation(self.eye.gazeCoords.astype(np.int32), prevGazeCoords)
+
+        t0 = time.time()
+        self.fixHistMap.decayFixations()
+        t_ior = time.time() - t0
+        print('[IOR] Time elapsed {:0.03f}'.format(t_ior))
+
     def add_subplot(self, fig, img, title, plot_idx):
         ax = fig.add_subplot(plot_idx)
         ax.set_title(title, fontsize=10)
@@ -167,3 +357,69 @@ class Controller:
         ax.get_yaxis().set_ticks([])
         ax.imshow(img)
         return ax
+
+
+#state of a subject which changes with every fixation, moved in and out of the controller when several
+#subjects are run in lockstep (see Controller.computeFixationsBatch)
+class SubjectState:
+    def __init__(self, controller):
+        self.store(controller)
+
+    def store(self, controller):
+        self.gazeCoords = controller.eye.gazeCoords
+        self.priorityMap = controller.priorityMap
+        self.fixHistMap = controller.fixHistMap
+        self.sceneWithFixations = controller.env.sceneWithFixations
+
+    def load(self, controller):
+        controller.eye.gazeCoords = self.gazeCoords
+        controller.priorityMap = self.priorityMap
+        controller.fixHistMap = self.fixHistMap
+        controller.env.sceneWithFixations = self.sceneWithFixations
+
+
+#state of the parent process inherited by the forked workers (see Controller.runWorkers)
+workerState = None
+
+def initWorker():
+    controller, initialSettings, threads = workerState
+    cv2.setNumThreads(threads)
+
+#returns (image, traceback or None, time)
+def runWorkerTask(task):
+    index, imgPath = task
+    controller, initialSettings, threads = workerState
+
+    if index == 0:
+        vars(controller.settings).update(copy.deepcopy(initialSettings))
+
+    t0 = time.time()
+    try:
+        controller.processImage(imgPath)
+    except Exception:
+        return imgPath, traceback.format_exc(), time.time() - t0
+    return imgPath, None, time.time() - t0
+
+
+#compare fixations computed with two model settings (returned by computeFixationLists), prints the
+#distances between corresponding fixations for each image and returns the distances of all fixations in deg
+#tag - prefix of the printed lines
+def compareFixationLists(reference, other, tag):
+    allDist = []
+    for imgPath, (refFixations, pix2deg) in reference.items():
+        otherFixations = other[imgPath][0]
+        n = min(len(refFixations), len(otherFixations))
+        dist = np.sqrt(np.sum((refFixations[:n] - otherFixations[:n]).astype(np.float64)**2, axis=1))/pix2deg
+        allDist.append(dist)
+
+        #fixations closer than the fovea (1 deg) are treated as the same
+        diverged = np.nonzero(dist > 1)[0]
+        firstDiverged = diverged[0]+1 if len(diverged) else 'none'
+        print('{} {}: fixation distance mean {:0.03f} deg, max {:0.03f} deg, first fixation more than 1 deg apart: {}'.format(
+            tag, imgPath, dist.mean() if n else 0, dist.max() if n else 0, firstDiverged))
+
+    allDist = np.concatenate(allDist) if allDist else np.zeros(0)
+    if len(allDist):
+        print('{} All images: fixation distance mean {:0.03f} deg, {:0.01f}% of fixations more than 1 deg apart'.format(
+            tag, allDist.mean(), 100*np.mean(allDist > 1)))
+    return allDist
@@ -1,42 +1,45 @@
-import tensorflow.compat.v1 as tf
 import numpy as np
 from scipy.ndimage import zoom
 from scipy.special import logsumexp
 import cv2
 
-tf.disable_eager_execution()
+from ShapeBuckets import ShapeBuckets
+from InferenceBackend import getBackend
 
 
 class DeepGazeII:
-    def __init__(self):
+    def __init__(self, bucketSize=0, maxBatch=8, intraOpThreads=0, interOpThreads=0, backend='tensorflow', sess=None, precision='float32'):
         #self.centerbias_template = np.load('contrib/DeepGazeII/centerbias.npy')
         check_point = 'contrib/DeepGazeII/DeepGazeII.ckpt'
-        tf.reset_default_graph()
-        new_saver = tf.train.import_meta_graph('{}.meta'.format(check_point))
+        #sess - TensorFlow session shared with other models (see ModelRegistry)
+        #precision - float32, float16 or int8 (see InferenceBackend)
+        self.backend = getBackend(backend, check_point, intraOpThreads, interOpThreads, sess, 'DeepGazeII', precision)
 
-        self.input_tensor = tf.get_collection('input_tensor')[0]
-        self.centerbias_tensor = tf.get_collection('centerbias_tensor')[0]
-        self.log_density = tf.get_collection('log_density')[0]
+        self.buckets = ShapeBuckets(bucketSize, maxBatch)
 
-        self.sess = tf.Session()
-        new_saver.restore(self.sess, check_point)
 
-
-    def compute_saliency(self, img=None):
+    def compute_saliency(self, img=None, scale=1.0):
         self.img = img.copy()
-
-        self.centerbias_data = np.zeros([1, self.img.shape[0], self.img.shape[1], 1], dtype=np.float32)
-
-        image_data = self.img[np.newaxis, :, :, :]
-        print(self.input_tensor)
-        log_density_prediction = self.sess.run(self.log_density, {
-            self.input_tensor: image_data,
-            self.centerbias_tensor: self.centerbias_data,
-        })
-
-        log_density = log_density_prediction[0, :, :, 0]
-        self.sm = np.exp(log_density)
-        self.sm /= np.sum(self.sm)
-        cv2.normalize(self.sm, self.sm, 0, 1, cv2.NORM_MINMAX)
-
+        self.sm = self.compute_saliency_batch([self.img], scale)[0]
         return self.sm
+
+    #saliency maps of a list of views, views are run in batches (see ShapeBuckets)
+    #scale < 1 - the views are downsampled before inference and the log-density is upsampled back to the
+    #view size (the readout of the network is very smooth, while the cost grows with the number of pixels)
+    def compute_saliency_batch(self, imgs, scale=1.0):
+        shapes = [img.shape[:2] for img in imgs]
+        if scale < 1:
+            imgs = [cv2.resize(img, (max(1, round(img.shape[1]*scale)), max(1, round(img.shape[0]*scale))), interpolation=cv2.INTER_AREA) for img in imgs]
+
+        log_densities = self.buckets.run(self.backend, imgs)
+
+        sms = []
+        for log_density, shape in zip(log_densities, shapes):
+            if log_density.shape != shape:
+                log_density = cv2.resize(log_density, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+            sm = np.exp(log_density)
+            sm /= np.sum(sm)
+            cv2.normalize(sm, sm, 0, 1, cv2.NORM_MINMAX)
+            sms.append(sm)
+
+        return sms
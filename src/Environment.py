@@ -10,12 +10,7 @@ class Environment:
     def __init__(self, settings):
 
         self.settings = settings
-
-        if self.settings.inputSizeDeg:
-            self.widthm = 2*self.settings.viewDist*math.tan((self.settings.inputSizeDeg*math.pi/180)/2)
-            self.dotPitchMethod = 'FROM_VIS_ANGLE_SIZE'
-        else:
-            self.dotPitchMethod = 'FROM_DEG2PIX'
+        self.initDotPitchMethod()
 
         self.scene = None
         self.sceneWithFixations = None
@@ -27,7 +22,17 @@ class Environment:
         self.dotPitch = -1
 
 
+    #updateDotPitch sets settings.inputSizeDeg, so the method is chosen again for every image and subject,
+    #the same as when the environment was created for each of them
+    def initDotPitchMethod(self):
+        if self.settings.inputSizeDeg:
+            self.widthm = 2*self.settings.viewDist*math.tan((self.settings.inputSizeDeg*math.pi/180)/2)
+            self.dotPitchMethod = 'FROM_VIS_ANGLE_SIZE'
+        else:
+            self.dotPitchMethod = 'FROM_DEG2PIX'
+
     def loadStaticStimulus(self, imgPath):
+        self.initDotPitchMethod()
         self.scene = cv2.imread(imgPath)
 
         if self.scene is None:
@@ -40,6 +45,12 @@ class Environment:
         self.padStaticStimulus()
         self.updateDotPitch()
 
+    #start a new subject on the loaded image (clears the drawn fixations)
+    def reset(self):
+        self.initDotPitchMethod()
+        self.sceneWithFixations = self.scene.astype(np.float32).copy()
+        self.updateDotPitch()
+
     def padStaticStimulus(self):
         if self.settings.paddingRGB[0] < 0:
             self.settings.paddingRGB = self.scene.mean(axis=(0,1))
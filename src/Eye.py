@@ -16,17 +16,30 @@ class Eye:
             #from Foveate_GP_OGL import Foveate_GP_OGL
             #self.fov = Foveate_GP_OGL(dotPitch = self.env.dotPitch, viewDist = settings.viewDist)
 
-            #uncomment to use the pyCUDA code
-            from Foveate import Foveate
-            self.fov = Foveate(self.env.dotPitch, self.settings.viewDist, self.settings.rodsAndCones)
+            if self.settings.foveateBackend == 'CPU':
+                from Foveate_CPU import Foveate_CPU
+                self.fov = Foveate_CPU(self.env.dotPitch, self.settings.viewDist, self.settings.rodsAndCones, self.settings.pyrlevelCacheDir, self.settings.foveateBlending)
+            else:
+                from Foveate import Foveate
+                self.fov = Foveate(self.env.dotPitch, self.settings.viewDist, self.settings.rodsAndCones, self.settings.pyrlevelCacheDir)
 
+            if self.settings.scenePyramid:
+                self.fov.setScene(self.env.scenePadded)
+
+    #start viewing the current scene of env from its center (for a new image or subject)
+    #the foveation state is kept if the view size and dotPitch are the same
     def reset(self):
-        self.height = self.env.getHeight()
-        self.width = self.env.getWidth()
-        self.gazeCoords = np.zeros((1, 2), dtype=np.int32)
+        self.height = self.env.height
+        self.width = self.env.width
+        self.gazeCoords = -np.ones((1, 2), dtype=np.int32)
         self.view = None
         self.viewFov = None
 
+        if self.foveate:
+            self.fov.setDotPitch(self.env.dotPitch)
+            if self.settings.scenePyramid and self.fov.scene is not self.env.scenePadded:
+                self.fov.setScene(self.env.scenePadded)
+
     def viewScene(self):
         # if gazeCoords are not initialized (i.e. equal to [-1,1]) automatically set the first
         # fixation at the center of the image
@@ -40,7 +53,11 @@ class Eye:
 
         if self.foveate:
             self.fov.dotPitch = self.env.dotPitch
-            self.fov.foveate(self.view, np.array([int(self.height/2), int(self.width/2)], dtype=np.int32))
+            if self.settings.scenePyramid:
+                #views are crops of the padded scene starting at gazeCoords
+                self.fov.foveate(self.view, np.array([int(self.height/2), int(self.width/2)], dtype=np.int32), sceneOffset=self.gazeCoords)
+            else:
+                self.fov.foveate(self.view, np.array([int(self.height/2), int(self.width/2)], dtype=np.int32))
             self.viewFov = self.fov.imgFov
 
         else:
@@ -2,21 +2,55 @@ import scipy.io as sio
 import numpy as np
 import math
 
+from Geometry import getDistancePlane
+
+#Inhibition of return (IOR)
+#Every fixation adds 1 - d/iorSizePx (d - distance to the fixation in the padded scene) to the history
+#within iorSizePx of it, the history is clipped at 1 and decays by 1/iorDecayRate (down to 0) after every
+#fixation. Instead of updating the whole padded map, the fixations are kept as records (position, time)
+#and the history is evaluated only for the requested window: for every pixel the records covering it
+#are replayed in order, with the decay between them applied in closed form (max(v - n/iorDecayRate, 0)
+#after n decays).
+#Once its own IOR has decayed to 0 (after decayLength fixations) a record is folded into a padded base
+#map, which stores for every pixel the history after the folded records and the time it was last
+#updated, and is decayed in the same closed form when read. Folding touches only the disc of the record,
+#so at most decayLength records are replayed whatever the number of fixations, and the result is the
+#same as replaying all of them. The base map is only allocated once there is a record to fold and is
+#dropped again when all of it has decayed to 0.
 class FixationHistoryMap:
     def __init__(self, h, w, hPadded, wPadded, settings):
+        self.settings = settings
+        self.reset(h, w, hPadded, wPadded)
+
+    #clear the history for a new subject or image
+    def reset(self, h, w, hPadded, wPadded):
         self.height = h
         self.width = w
         self.hPadded = hPadded
         self.wPadded = wPadded
-        self.iorSizePx = int(settings.iorSizeDeg*settings.pix2deg)
-        self.settings = settings
+        self.iorSizePx = int(self.settings.iorSizeDeg*self.settings.pix2deg)
 
         self.fixHistMap = np.zeros((self.height, self.width), dtype=np.float32)
-        self.fixHistMapPadded = np.zeros((self.hPadded, self.wPadded), dtype=np.float32)
 
         self.lastFixation = None
         self.fixationList = np.empty((0, 2), dtype=np.int32)
 
+        #IOR added around a fixation (1 - d/iorSizePx, 0 outside of the disc)
+        size = 2*self.iorSizePx + 1
+        if self.iorSizePx > 0:
+            self.iorKernel = np.maximum(1 - getDistancePlane(size, size, self.iorSizePx, self.iorSizePx)/self.iorSizePx, 0)
+        else:
+            self.iorKernel = None
+
+        self.decayStep = 1/self.settings.iorDecayRate
+        #number of decays after which any history (at most 1) is 0
+        self.decayLength = math.ceil(self.settings.iorDecayRate) + 1
+        self.time = 0 #number of decays so far
+        self.records = [] #(row, col, time) of the fixations in the padded scene
+        self.base = None #history after the folded records, at baseTime
+        self.baseTime = None
+        self.lastFolded = 0 #time of the last folded record
+
 
     def saveFixationCoords(self, fixCoords):
         self.lastFixation = fixCoords
@@ -24,22 +58,90 @@ class FixationHistoryMap:
 
         self.fixationList = np.append(self.fixationList, [fixCoords], axis=0)
         #add inhibition area around the new fixation with radius iorSizePx
-        for i in range(fixCoordsPadded[0]-self.iorSizePx, fixCoordsPadded[0]+self.iorSizePx):
-            for j in range(fixCoordsPadded[1]-self.iorSizePx, fixCoordsPadded[1]+self.iorSizePx):
-                d = math.sqrt((fixCoordsPadded[0]-i)*(fixCoordsPadded[0]-i) + (fixCoordsPadded[1]-j)*(fixCoordsPadded[1]-j))
-                if d <= self.iorSizePx:
-                    self.fixHistMapPadded[i,j] = min(1, self.fixHistMapPadded[i,j] + 1 - d/self.iorSizePx)
+        if self.iorKernel is not None:
+            self.records.append((int(fixCoordsPadded[0]), int(fixCoordsPadded[1]), self.time))
+            self.pruneRecords()
+
+    #fold the records whose own IOR has decayed to 0 into the base map (oldest first, so the base map
+    #always holds the history before the remaining records)
+    def pruneRecords(self):
+        while self.records and self.time - self.records[0][2] >= self.decayLength:
+            self.foldRecord(*self.records.pop(0))
+
+        #everything in the base map is at most 1, so it is 0 decayLength decays after the last fold. It is
+        #dropped once that is the case before the oldest remaining record (which is replayed on top of it)
+        oldest = self.records[0][2] if self.records else self.time
+        if self.base is not None and oldest - self.lastFolded >= self.decayLength:
+            self.base = None
+            self.baseTime = None
+
+    def foldRecord(self, row, col, t):
+        if self.base is None:
+            self.base = np.zeros((self.hPadded, self.wPadded), dtype=np.float32)
+            self.baseTime = np.zeros((self.hPadded, self.wPadded), dtype=np.int32)
+
+        r = self.iorSizePx
+        y0, y1 = max(0, row - r), min(self.hPadded, row + r + 1)
+        x0, x1 = max(0, col - r), min(self.wPadded, col + r + 1)
+        if y0 >= y1 or x0 >= x1:
+            return
+
+        box = (slice(y0, y1), slice(x0, x1))
+        kernel = self.iorKernel[y0 - row + r:y1 - row + r, x0 - col + r:x1 - col + r]
+        values = np.maximum(self.base[box] - (t - self.baseTime[box])*self.decayStep, 0)
+        np.minimum(values + kernel, 1, out=values)
+        self.base[box] = values
+        self.baseTime[box] = t
+        self.lastFolded = t
 
     def decayFixations(self):
-        self.fixHistMapPadded -= 1/self.settings.iorDecayRate
-        self.fixHistMapPadded = np.fmax(self.fixHistMapPadded, np.zeros((self.hPadded, self.wPadded)))
+        self.time += 1
+
+    #history of the window of the padded scene starting at (top, left)
+    def renderWindow(self, top, left, h, w):
+        histMap = np.zeros((h, w), dtype=np.float64)
+        r = self.iorSizePx
+
+        #parts of the discs of the records inside the window
+        discs = []
+        for row, col, t in self.records:
+            y0, y1 = max(top, row - r), min(top + h, row + r + 1)
+            x0, x1 = max(left, col - r), min(left + w, col + r + 1)
+            if y0 < y1 and x0 < x1:
+                discs.append((y0, y1, x0, x1, row, col, t))
+        if self.base is not None:
+            #the whole window starts from the base map
+            top0, bottom0, left0, right0 = top, top + h, left, left + w
+            hist = self.base[top0:bottom0, left0:right0].astype(np.float64)
+            lastTime = self.baseTime[top0:bottom0, left0:right0].astype(np.float64)
+        elif discs:
+            #only the bounding box of the discs is evaluated, the rest of the window is 0
+            top0, bottom0 = min(disc[0] for disc in discs), max(disc[1] for disc in discs)
+            left0, right0 = min(disc[2] for disc in discs), max(disc[3] for disc in discs)
+            hist = np.zeros((bottom0 - top0, right0 - left0), dtype=np.float64)
+            lastTime = np.zeros_like(hist)
+        else:
+            return histMap
+
+        for y0, y1, x0, x1, row, col, t in discs:
+            box = (slice(y0 - top0, y1 - top0), slice(x0 - left0, x1 - left0))
+            kernel = self.iorKernel[y0 - row + r:y1 - row + r, x0 - col + r:x1 - col + r]
+
+            #decay since the previous record, then add the IOR of this one
+            values = np.maximum(hist[box] - (t - lastTime[box])*self.decayStep, 0)
+            np.minimum(values + kernel, 1, out=values)
+            hist[box] = values
+            lastTime[box] = t
+
+        histMap[top0 - top:bottom0 - top, left0 - left:right0 - left] = np.maximum(hist - (self.time - lastTime)*self.decayStep, 0)
+        return histMap
 
     def getFixationHistoryMap(self):
         #when there is no history of fixations yet return map of 0s
         if self.lastFixation is None:
             return self.fixHistMap
         else:
-            return self.fixHistMapPadded[self.lastFixation[0]:self.lastFixation[0]+self.height, self.lastFixation[1]:self.lastFixation[1]+self.width]
+            return self.renderWindow(self.lastFixation[0], self.lastFixation[1], self.height, self.width)
 
     def dumpFixationsToMat(self, savePath):
         fixationList = np.fliplr(self.fixationList).astype(np.float64) # flip array since save format is [horz_coord, vert_coord]
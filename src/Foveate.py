@@ -17,15 +17,14 @@ import cv2
 import sys
 import os
 
-class Foveate:
-    def __init__(self, dotPitch, viewDist, rodsAndCones):
-        self.CTO = 1/64 #constant from Geisler & Perry
-        self.alpha = 0.106  #constant from Geisler & Perry
-        self.epsilon2 = 2.3 #constant from Geisler & Perry
+from PyrlevelCache import getPyrlevelCache
 
+class Foveate:
+    def __init__(self, dotPitch, viewDist, rodsAndCones, cacheDir=None):
         self.dotPitch = dotPitch
         self.viewDist = viewDist
         self.rodsAndCones = rodsAndCones
+        self.cacheDir = cacheDir
 
         self.origW = -1
         self.origH = -1
@@ -37,6 +36,9 @@ class Foveate:
         self.pyrlevel_d = None
         self.fov_d = None
 
+        self.scene = None
+        self.scenePyramid = None
+
         self.device = cuda.Device(0)
         self.context = self.device.make_context()
         self.loadKernel()
@@ -45,6 +47,20 @@ class Foveate:
     def setImage(self, img):
         self.img = img.copy()
 
+    #the pyramid level maps depend on dotPitch, so they are recomputed for the next view if it changes
+    def setDotPitch(self, dotPitch):
+        if dotPitch != self.dotPitch:
+            self.dotPitch = dotPitch
+            self.origH = -1
+            self.origW = -1
+
+    #use a pyramid computed once over the scene instead of rebuilding it for every view
+    #foveate() then expects sceneOffset, the position of the view's top-left corner in the scene
+    #see Foveate_CPU.setScene for how the result differs from per-view pyramids
+    def setScene(self, scene):
+        self.scene = scene
+        self.scenePyramid = None
+
     def allocate_GPU_mem(self):
         self.pyramid_d = cuda.mem_alloc(self.pyramid.nbytes)
         self.pyrlevel_d = cuda.mem_alloc(self.pyrlevelCones.nbytes)
@@ -66,12 +82,8 @@ class Foveate:
 
         self.pyramid = np.zeros((self.numLevels, self.origH, self.origW), dtype=np.float32)
 
-        x, step = np.linspace(0, self.origH-1, num=self.origH, retstep=True, dtype=np.float32)
-        y, step = np.linspace(0, self.origW-1, num=self.origW, retstep=True, dtype=np.float32)
-
-        self.ix, self.iy = np.meshgrid(y, x, sparse=False, indexing='xy')
-
-        self.ec = None
+        #level stacks of the scene depend on numLevels
+        self.scenePyramid = None
 
 
     def loadKernel(self):
@@ -289,54 +301,30 @@ class Foveate:
 
 
     def preprocess(self, gazePos):
-
-        #eradius is the radial distance between each point and the point of gaze in meters.
-        distPx = np.sqrt(np.power(self.ix-gazePos[1], 2) + np.power(self.iy-gazePos[0], 2))
-        eradius = distPx*self.dotPitch
-
-        #ec - eccentricity from the fovea center for each pixel in degrees
-        ec = 180*np.arctan(eradius/self.viewDist)/math.pi
-
-        eyefreqCones = self.epsilon2/(self.alpha*(ec + self.epsilon2))*math.log(1/self.CTO)
-        #eyefreqCones = np.power(eyefreqCones, 0.3)
-
-        maxVal = np.amax(eyefreqCones)
-        minVal = np.amin(eyefreqCones)
-
-        eyefreqCones = (eyefreqCones-minVal)/(maxVal-minVal)
-
-        #pyrlevel is a fractional level of the pyramid which must be used at each pixel
-        #in order to match the foveal resolution function defined above
-        eyefreqCones = 1 - eyefreqCones
-        self.pyrlevelCones = (self.numLevels-1)*eyefreqCones
-
-        #constrain pyrlevel to conform to the levels of the pyramid which have been computed
-        self.pyrlevelCones = np.maximum(0, np.minimum(self.numLevels, self.pyrlevelCones))
-
-        if self.rodsAndCones:
-            #this is a bit ad hoc
-            #the function was fitted manually in Matlab to resemble distribution of rods in the retina
-            #likely we will need something better for the next version of STAR
-            p = np.array([8.8814e-11,  -1.6852e-07,   1.1048e-04,  -3.1856e-02,   3.7501e+00,  -3.0283e+00])
-            eyefreqRods = self.evalpoly(distPx, p, 5)
-
-            maxVal = np.amax(eyefreqRods)
-            eyefreqRods = eyefreqRods/maxVal
-            eyefreqRods = 1 - eyefreqRods
-            self.pyrlevelRods = np.maximum(0, np.minimum(self.numLevels, self.numLevels*eyefreqRods+2))
+        #pyrlevel maps depend only on the view geometry, so they are shared through the cache
+        cache = getPyrlevelCache(self.cacheDir)
+        self.pyrlevelCones, self.pyrlevelRods = cache.getPyrlevels(self.origH, self.origW, gazePos, self.dotPitch, self.viewDist, self.rodsAndCones, self.numLevels)
 
     #for color images compute transform for each channel separately
     #and combine them for the final result
-    def interpolate(self):
+    def interpolate(self, sceneOffset=None):
         #since rods affect only intensity, convert image to YCrCb colorspace
-        if self.rodsAndCones:
+        if sceneOffset is not None:
+            numChannels = len(self.scenePyramid)
+        elif self.rodsAndCones:
             #this cv2 colorspace conversion only works on uint8 images
             img = cv2.cvtColor(self.img.astype(np.uint8), cv2.COLOR_BGR2YCrCb)
+            numChannels = img.shape[2]
         else:
             img = self.img;
+            numChannels = img.shape[2]
 
-        for c in range(img.shape[2]):
-            self.computeImagePyramid(img[:, :, c].astype(np.float32))
+        for c in range(numChannels):
+            if sceneOffset is None:
+                self.computeImagePyramid(img[:, :, c].astype(np.float32))
+            else:
+                #slice the view out of the scene levels
+                self.pyramid[...] = self.scenePyramid[c][:, sceneOffset[0]:sceneOffset[0]+self.origH, sceneOffset[1]:sceneOffset[1]+self.origW]
 
             #compute rods only for the first channel (intensity)
             if self.rodsAndCones and c == 0:
@@ -355,7 +343,7 @@ class Foveate:
         #cv2.normalize(self.imgFov, self.imgFov, 0, 1, cv2.NORM_MINMAX)
 
 
-    def foveate(self, img, gazePos):
+    def foveate(self, img, gazePos, sceneOffset=None):
 
         self.setImage(img)
         if self.origH != img.shape[0] or self.origW != img.shape[1]:
@@ -365,10 +353,30 @@ class Foveate:
             self.allocate_GPU_mem()
             self.context.pop()
 
+        if sceneOffset is not None and self.scenePyramid is None:
+            self.computeScenePyramid()
+
         self.context.push()
-        self.interpolate()
+        self.interpolate(sceneOffset)
         self.context.pop()
 
+    def computeScenePyramid(self):
+        scene = self.scene
+        if self.rodsAndCones:
+            scene = cv2.cvtColor(scene.astype(np.uint8), cv2.COLOR_BGR2YCrCb)
+
+        self.scenePyramid = []
+        for c in range(scene.shape[2]):
+            pyramid = np.zeros((self.numLevels, scene.shape[0], scene.shape[1]), dtype=np.float32)
+            tmp = scene[:, :, c].astype(np.float32)
+            pyramid[0, :, :] = tmp
+
+            for i in range(1, self.numLevels):
+                tmp = cv2.pyrDown(tmp, dstsize=(round(tmp.shape[1]/2), round(tmp.shape[0]/2)), borderType=cv2.BORDER_DEFAULT)
+                pyramid[i, :, :] = cv2.resize(tmp, (scene.shape[1], scene.shape[0]), cv2.INTER_LINEAR)
+
+            self.scenePyramid.append(pyramid)
+
 
     def computeImagePyramid(self, img):
         self.pyramid[0, :, :] = img.copy()
@@ -398,15 +406,6 @@ class Foveate:
 
         return fov
 
-    # using the numpy built-in polyval instead
-    #use Horner's method to evaluate polynomial
-    def evalpoly(self, x, p, nc):
-        y = np.zeros(x.shape) + p[0]
-        for i in range(1, nc+1):
-            np.multiply(x, y, out=y)
-            y += p[i]
-        return y.astype(np.float32)
-
 
 # run as 
 # python3 src/Foveate.py <img_path> <gaze_pos>
@@ -0,0 +1,359 @@
+#CPU-only version of the Geisler & Perry foveation in Foveate.py
+#
+#Produces the same output as the pyCUDA interpolate_bicubic_GPU kernel, but blends the pyramid
+#levels with vectorized NumPy/OpenCV code instead of one CUDA block per pixel. Since the gaze
+#position and the image size are fixed for a given view, the pixels are split once in preprocess()
+#into rings of equal integer pyramid level, each with its own set of levels and weights, and only
+#the pyramid changes between calls.
+#
+#The pyramid stores only the true downsampled levels (about 1.33x the size of the image). A level
+#is upsampled lazily, only at the pixels of the rings that use it, with the same bilinear mapping
+#as cv2.resize, instead of keeping numLevels full resolution copies of the image.
+#
+#All channels are processed together as one HxWx3 stack: a single pyramid per view and one pass
+#per level, with the rods/cones mixing done in float (see interpolate()).
+#
+#Tolerance: compared to Foveate.py the output differs only by float32 rounding and the 1/32 pixel
+#precision of cv2.remap (max abs difference below 0.5 on the [0, 255] scale). With rodsAndCones
+#Foveate.py truncates the image to uint8 for the YCrCb conversions, so pixels differ by about
+#1 grey level on average and by at most 4.
+#This excludes the pixels where the bicubic blend overshoots the pixel range (at sharp edges): here
+#they are clipped to [0, 255], while Foveate.py casts them to uint8, which wraps them around (e.g. -3
+#becomes 253). With trackOvershoot set, foveate() marks these pixels in overshoot.
+#
+#blending selects how the levels are combined:
+#   bicubic - cubic interpolation over 4 levels, as interpolate_bicubic_GPU (default, the tolerance
+#             above applies only to it)
+#   linear - each ring is blended from only the two levels bracketing it. Faster, but not the same
+#            as Foveate.py: on average about 0.3-0.5 grey levels from bicubic and up to about 6.
+#            Run this file as a script to print the difference for an image.
+#
+#If a scene is set with setScene(), the pyramid is built once over the whole (padded) scene and
+#every view is blended straight from it. This is not equivalent to per-view pyramids, see setScene()
+#for the measured differences.
+
+import numpy as np
+import math
+import cv2
+import sys
+import os
+
+from PyrlevelCache import getPyrlevelCache
+
+#weights of the B, G and R channels in the Y channel of YCrCb (as in cv2.COLOR_BGR2YCrCb)
+LUMA_BGR = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+#cv2.remap only accepts maps with sides below 32767, so pixel lists are remapped in rows of this length
+REMAP_ROW = 1024
+
+class Foveate_CPU:
+    def __init__(self, dotPitch, viewDist, rodsAndCones, cacheDir=None, blending='bicubic'):
+        self.dotPitch = dotPitch
+        self.viewDist = viewDist
+        self.rodsAndCones = rodsAndCones
+        self.cacheDir = cacheDir
+        self.blending = blending
+
+        self.origW = -1
+        self.origH = -1
+
+        self.img = None
+        self.imgFov = None
+
+        self.planCones = None
+        self.planRods = None
+
+        self.scene = None
+        self.scenePyramid = None
+        self.sceneLumaPyramid = None
+
+        #HxW bool map of the pixels Foveate.py wraps around (only computed if trackOvershoot is set)
+        self.trackOvershoot = False
+        self.overshoot = None
+
+    def setImage(self, img):
+        self.img = img.copy()
+
+    #the pyramid level maps depend on dotPitch, so they are recomputed for the next view if it changes
+    def setDotPitch(self, dotPitch):
+        if dotPitch != self.dotPitch:
+            self.dotPitch = dotPitch
+            self.origH = -1
+            self.origW = -1
+
+    #use a pyramid computed once over the scene instead of rebuilding it for every view
+    #foveate() then expects sceneOffset, the position of the view's top-left corner in the scene
+    #NOTE: this is not identical to per-view pyramids: near the view borders pyrDown sees the
+    #actual scene content instead of the reflected view, and the coarse levels are sampled on the
+    #scene grid, so they are shifted by a fraction of a pixel unless sceneOffset is a multiple of
+    #2^level. Measured on images/Yarbus_scaled.jpg (45 deg, rodsAndCones, either blending) the
+    #mean abs difference is 0.6-1.7 grey levels (on the [0, 255] scale) with a max of 24-76 for
+    #most views. The initial view at the image center is the worst case (mean 3.0, max 63): its
+    #borders are the image borders, which the per-view pyramid reflects while the scene pyramid
+    #sees the padding. Run this file as a script to print the difference for an image.
+    def setScene(self, scene):
+        self.scene = scene
+        self.scenePyramid = None
+        self.sceneLumaPyramid = None
+
+    def init(self):
+        self.origH = self.img.shape[0]
+        self.origW = self.img.shape[1]
+
+        self.numLevels = min(7, math.floor(math.log2(max(self.origH, self.origW))))
+
+        self.imgFov = np.empty_like(self.img)
+
+        self.pyrlevelCones = None
+        self.pyrlevelRods = None
+        self.planCones = None
+        self.planRods = None
+
+        #level stacks of the scene depend on numLevels
+        self.scenePyramid = None
+        self.sceneLumaPyramid = None
+
+    def preprocess(self, gazePos):
+        #pyrlevel maps depend only on the view geometry, so they are shared through the cache
+        cache = getPyrlevelCache(self.cacheDir)
+        self.pyrlevelCones, self.pyrlevelRods = cache.getPyrlevels(self.origH, self.origW, gazePos, self.dotPitch, self.viewDist, self.rodsAndCones, self.numLevels)
+
+    def updateBlendPlans(self, pyrH, pyrW):
+        self.planCones = self.computeBlendPlan(self.pyrlevelCones, pyrH, pyrW)
+        if self.rodsAndCones:
+            self.planRods = self.computeBlendPlan(self.pyrlevelRods, pyrH, pyrW)
+
+    #split the pixels into bands of equal integer level, which are rings around the gaze position,
+    #and precompute for each band its pixels and the levels it reads with their per-pixel weights
+    #
+    #the 4x4x4 neighbourhood of the CUDA kernel starts at floor(x)-2, so for the integer pixel
+    #coordinates it reduces to a cubic interpolation across levels, taken at pixel (x-1, y-1)
+    #and level pyrlevel-1 (level indices are clamped to the pyramid like in access_)
+    #the linear plan uses the same pixel and level, but only the two levels bracketing it
+    #
+    #pyrH, pyrW are the dimensions of the image the pyramid was built from
+    def computeBlendPlan(self, pyrlevel, pyrH, pyrW):
+        pyrlevel = pyrlevel.astype(np.float32).ravel()
+        if self.blending == 'linear':
+            pyrlevel = np.maximum(pyrlevel - 1, 0)
+        elif self.blending != 'bicubic':
+            raise ValueError('Unrecognized blending method {}!'.format(self.blending))
+
+        zFloor = np.floor(pyrlevel)
+        dz = pyrlevel - zFloor
+        zFloor = zFloor.astype(np.intp)
+
+        rows = np.maximum(np.arange(self.origH) - 1, 0)
+        cols = np.maximum(np.arange(self.origW) - 1, 0)
+        rows, cols = np.meshgrid(rows, cols, indexing='ij')
+        rows = rows.ravel()
+        cols = cols.ravel()
+
+        bands = []
+        for band in np.unique(zFloor):
+            outIdx = np.flatnonzero(zFloor == band)
+            bandDz = dz[outIdx]
+
+            if self.blending == 'linear':
+                levels = [band, band+1]
+                weights = [1 - bandDz, bandDz]
+            else:
+                dzz = bandDz*bandDz
+                dzzz = dzz*bandDz
+                levels = [band-2, band-1, band, band+1]
+                weights = [0.5*(-bandDz + 2*dzz - dzzz), 0.5*(2 - 5*dzz + 3*dzzz), 0.5*(bandDz + 4*dzz - 3*dzzz), 0.5*(-dzz + dzzz)]
+
+            #merge taps that are clamped to the same level
+            taps = {}
+            for level, w in zip(levels, weights):
+                level = min(max(level, 0), self.numLevels-1)
+                taps[level] = taps[level] + w if level in taps else w
+            taps = [(level, w.astype(np.float32)[:, np.newaxis]) for level, w in sorted(taps.items())]
+
+            bands.append((outIdx, rows[outIdx], cols[outIdx], taps))
+
+        return bands, (pyrH, pyrW)
+
+    #all color channels are blended in one pass over the HxWx3 pyramid
+    def interpolate(self, sceneOffset=None):
+        if sceneOffset is None:
+            img = self.img.astype(np.float32)
+            pyramid = self.computeImagePyramid(img)
+            lumaPyramid = self.computeImagePyramid(np.dot(img, LUMA_BGR)) if self.rodsAndCones else None
+            offset = None
+        else:
+            pyramid = self.scenePyramid
+            lumaPyramid = self.sceneLumaPyramid
+            offset = (int(sceneOffset[0]), int(sceneOffset[1]))
+
+        fov = self.interp3(self.planCones, pyramid, offset)
+
+        if self.rodsAndCones:
+            #rods affect only intensity, so the original mixes 0.7*cones + 0.3*rods in the Y channel
+            #of YCrCb (mixing proportions are approximate, see JEMR paper for justification)
+            #the conversion is linear and Y enters every BGR channel with weight 1 when converting
+            #back, so in float this is the same as adding the luma difference to all channels
+            #(rods are blended from a separate luma pyramid, which equals the luma of the BGR pyramid)
+            fovRods = self.interp3(self.planRods, lumaPyramid, offset)
+            fovRods -= np.dot(fov, LUMA_BGR)[:, np.newaxis]
+            fov += 0.3*fovRods
+
+        if self.trackOvershoot:
+            self.overshoot = getOvershoot(fov, self.rodsAndCones).reshape(self.origH, self.origW)
+
+        np.clip(fov, 0, 255, out=fov)
+        fov = fov.reshape(self.origH, self.origW, -1)
+
+        if self.rodsAndCones:
+            self.imgFov = fov
+        else:
+            self.imgFov[...] = fov
+
+    def foveate(self, img, gazePos, sceneOffset=None):
+
+        self.setImage(img)
+        if self.origH != img.shape[0] or self.origW != img.shape[1]:
+            self.init()
+            self.preprocess(gazePos)
+
+        if sceneOffset is None:
+            pyrShape = (self.origH, self.origW)
+        else:
+            if self.scenePyramid is None:
+                self.computeScenePyramid()
+            pyrShape = self.scene.shape[:2]
+
+        #plans index into either the view or the scene pyramid
+        if self.planCones is None or self.planCones[1] != pyrShape:
+            self.updateBlendPlans(*pyrShape)
+
+        self.interpolate(sceneOffset)
+
+    def computeScenePyramid(self):
+        scene = self.scene.astype(np.float32)
+        self.scenePyramid = self.computeImagePyramid(scene)
+
+        if self.rodsAndCones:
+            self.sceneLumaPyramid = self.computeImagePyramid(np.dot(scene, LUMA_BGR))
+
+    #returns the list of downsampled levels, the first one is the image itself
+    def computeImagePyramid(self, img):
+        pyramid = [img]
+        tmp = img
+
+        for i in range(1, self.numLevels):
+            tmp = cv2.pyrDown(tmp, dstsize=(round(tmp.shape[1]/2), round(tmp.shape[0]/2)), borderType=cv2.BORDER_DEFAULT)
+            pyramid.append(tmp)
+
+        return pyramid
+
+    #value of a pyramid level upsampled to pyrShape (as cv2.resize with INTER_LINEAR would do),
+    #evaluated only at the given pixels
+    def sampleLevel(self, pyramid, level, rows, cols, pyrShape):
+        levelImg = pyramid[level]
+        if level == 0:
+            pixels = levelImg.reshape(pyrShape[0]*pyrShape[1], -1)
+            return np.take(pixels, rows*pyrShape[1] + cols, axis=0)
+
+        #cv2.resize maps destination pixel x to source coordinate (x+0.5)*scale-0.5
+        #and replicates the border pixels, which is what BORDER_REPLICATE does in remap
+        scaleY = levelImg.shape[0]/pyrShape[0]
+        scaleX = levelImg.shape[1]/pyrShape[1]
+
+        n = rows.shape[0]
+        mapSize = -(-n // REMAP_ROW)*REMAP_ROW
+        mapY = np.zeros(mapSize, dtype=np.float32)
+        mapX = np.zeros(mapSize, dtype=np.float32)
+        mapY[:n] = rows*scaleY + (0.5*scaleY - 0.5)
+        mapX[:n] = cols*scaleX + (0.5*scaleX - 0.5)
+
+        values = cv2.remap(levelImg, mapX.reshape(-1, REMAP_ROW), mapY.reshape(-1, REMAP_ROW), cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return values.reshape(mapSize, -1)[:n]
+
+    #blend the pyramid levels using the plan from computeBlendPlan
+    #offset shifts the pixels to the view position when blending from the scene pyramid
+    #returns an (H*W)xC array of blended pixels
+    def interp3(self, plan, pyramid, offset=None):
+        bands, pyrShape = plan
+        numChannels = pyramid[0].shape[2] if pyramid[0].ndim == 3 else 1
+        fov = np.empty((self.origH*self.origW, numChannels), dtype=np.float32)
+
+        for outIdx, rows, cols, taps in bands:
+            if offset is not None:
+                rows = rows + offset[0]
+                cols = cols + offset[1]
+
+            level, weights = taps[0]
+            bandFov = self.sampleLevel(pyramid, level, rows, cols, pyrShape)
+            bandFov *= weights
+            for level, weights in taps[1:]:
+                bandFov += self.sampleLevel(pyramid, level, rows, cols, pyrShape)*weights
+            fov[outIdx] = bandFov
+
+        return fov
+
+
+#pixels of an (H*W)x3 BGR blend (before clipping) which Foveate.py wraps around when casting to uint8
+#(values <= -1 or >= 256). With rodsAndCones it casts the blended YCrCb channels, which are an affine
+#function of BGR (as in cv2.COLOR_BGR2YCrCb), so these are checked instead
+def getOvershoot(fov, rodsAndCones):
+    if rodsAndCones:
+        luma = np.dot(fov, LUMA_BGR)
+        channels = [luma, (fov[:, 2] - luma)*0.713 + 128, (fov[:, 0] - luma)*0.564 + 128]
+    else:
+        channels = [fov[:, c] for c in range(fov.shape[1])]
+    return np.any([(channel <= -1) | (channel >= 256) for channel in channels], axis=0)
+
+
+# run as
+# python3 src/Foveate_CPU.py <img_path> <gaze_pos>
+# e.g.
+# python3 src/Foveate_CPU.py images/Yarbus_scaled.jpg 100,100
+# if pyCUDA is available the result is also compared against Foveate.py
+if __name__ == '__main__':
+    img_path = sys.argv[1]
+    img = cv2.imread(img_path)
+
+    gaze_pos = [int(x) for x in sys.argv[2].split(',')]
+
+    viewDist = 1
+    inputSizeDeg = 82
+    rodsAndCones = True
+
+    widthm = 2*viewDist*math.tan((inputSizeDeg*math.pi/180)/2)
+    dotPitch = widthm/img.shape[1]
+
+    fov = Foveate_CPU(dotPitch, viewDist, rodsAndCones, blending='bicubic')
+    fov.trackOvershoot = True
+    fov.foveate(img, np.array(gaze_pos))
+
+    fovLinear = Foveate_CPU(dotPitch, viewDist, rodsAndCones, blending='linear')
+    fovLinear.foveate(img, np.array(gaze_pos))
+    diff = np.abs(fov.imgFov.astype(np.float32) - fovLinear.imgFov.astype(np.float32))
+    print('[Foveate_CPU] linear vs bicubic blending: max abs difference {:0.04f}, mean {:0.06f}'.format(diff.max(), diff.mean()))
+
+    fname, ext = os.path.splitext(img_path)
+    save_path = fname +'_fov_cpu'+ ext
+
+    cv2.imwrite(save_path, fov.imgFov.astype(np.uint8))
+
+    #the same view blended from a pyramid of the padded scene (as in Environment), the view is
+    #centered on the image, i.e. it is the image itself
+    h, w = img.shape[:2]
+    scene = cv2.copyMakeBorder(img, round(h/2), round(h/2), round(w/2), round(w/2), cv2.BORDER_CONSTANT, value=img.mean(axis=(0,1)))
+    fovScene = Foveate_CPU(dotPitch, viewDist, rodsAndCones, blending='bicubic')
+    fovScene.setScene(scene)
+    fovScene.foveate(img, np.array(gaze_pos), sceneOffset=np.array([round(h/2), round(w/2)]))
+    diff = np.abs(fov.imgFov.astype(np.float32) - fovScene.imgFov.astype(np.float32))
+    print('[Foveate_CPU] scene vs per-view pyramid: max abs difference {:0.04f}, mean {:0.06f}'.format(diff.max(), diff.mean()))
+
+    try:
+        from Foveate import Foveate
+    except ImportError:
+        sys.exit(0)
+
+    fovGPU = Foveate(dotPitch, viewDist, rodsAndCones)
+    fovGPU.foveate(img, np.array(gaze_pos))
+    #the tolerance does not apply to the pixels that overshoot the pixel range (see the top of this file)
+    diff = np.abs(fov.imgFov.astype(np.float32) - fovGPU.imgFov.astype(np.float32))[~fov.overshoot]
+    print('[Foveate_CPU] max abs difference to pyCUDA {:0.04f}, mean {:0.06f} ({} overshoot pixels excluded)'.format(diff.max(), diff.mean(), np.count_nonzero(fov.overshoot)))
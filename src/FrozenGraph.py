@@ -0,0 +1,112 @@
+#loading of the TensorFlow saliency models (DeepGazeII and ICF)
+#
+#Restoring the checkpoints (import_meta_graph + restore) takes several seconds, so each model can be
+#exported once to a frozen graph: the variables are converted to constants and the graph is pruned to
+#the nodes needed for the log-density (and optimized for inference). The frozen graph is stored next
+#to the checkpoint as <checkpoint>.frozen.pb (with the tensor names in <checkpoint>.frozen.json) and is
+#loaded instead of the checkpoint if it is not older than it. Constant folding of the remaining
+#subgraphs is done by TensorFlow's graph optimizer when the session is created.
+
+import json
+import os
+import sys
+
+import tensorflow.compat.v1 as tf
+from tensorflow.python.tools import optimize_for_inference_lib
+
+tf.disable_eager_execution()
+
+#collections of the checkpoints holding the model inputs and output
+TENSORS = ['input_tensor', 'centerbias_tensor', 'log_density']
+
+
+def getFrozenPath(checkPoint):
+    return checkPoint + '.frozen.pb'
+
+def getTensorNamesPath(checkPoint):
+    return checkPoint + '.frozen.json'
+
+#intraOpThreads, interOpThreads - sizes of TensorFlow thread pools (0 - TensorFlow default, i.e. all cores)
+def getSessionConfig(intraOpThreads=0, interOpThreads=0):
+    return tf.ConfigProto(intra_op_parallelism_threads=intraOpThreads, inter_op_parallelism_threads=interOpThreads)
+
+def isFrozen(checkPoint):
+    frozenPath = getFrozenPath(checkPoint)
+    if not os.path.exists(frozenPath) or not os.path.exists(getTensorNamesPath(checkPoint)):
+        return False
+    metaPath = '{}.meta'.format(checkPoint)
+    return not os.path.exists(metaPath) or os.path.getmtime(frozenPath) >= os.path.getmtime(metaPath)
+
+#returns the session and the input, centerbias and log-density tensors of the model
+#if sess is given, the model is added to its graph under the name scope (so several models can share
+#one graph and session, see ModelRegistry), otherwise it gets its own session
+def loadModel(checkPoint, intraOpThreads=0, interOpThreads=0, sess=None, scope=None):
+    if sess is None:
+        if isFrozen(checkPoint):
+            sess = tf.Session(graph=tf.Graph(), config=getSessionConfig(intraOpThreads, interOpThreads))
+        else:
+            tf.reset_default_graph()
+            sess = tf.Session(config=getSessionConfig(intraOpThreads, interOpThreads))
+
+    graph = sess.graph
+    prefix = scope + '/' if scope else ''
+
+    with graph.as_default():
+        if isFrozen(checkPoint):
+            graphDef = tf.GraphDef()
+            with open(getFrozenPath(checkPoint), 'rb') as f:
+                graphDef.ParseFromString(f.read())
+            with open(getTensorNamesPath(checkPoint), 'r') as f:
+                names = json.load(f)
+
+            tf.import_graph_def(graphDef, name=scope or '')
+            tensors = [graph.get_tensor_by_name(prefix + names[name]) for name in TENSORS]
+        else:
+            new_saver = tf.train.import_meta_graph('{}.meta'.format(checkPoint), import_scope=scope)
+            tensors = [graph.get_collection(name, scope=scope)[0] for name in TENSORS]
+            new_saver.restore(sess, checkPoint)
+
+    return (sess, *tensors)
+
+#export the checkpoint to a frozen graph, see the top of the file
+def freezeModel(checkPoint):
+    graph = tf.Graph()
+    with graph.as_default():
+        saver = tf.train.import_meta_graph('{}.meta'.format(checkPoint), clear_devices=True)
+        tensors = {name: tf.get_collection(name)[0] for name in TENSORS}
+
+        with tf.Session(graph=graph) as sess:
+            saver.restore(sess, checkPoint)
+            outputNode = tensors['log_density'].op.name
+            graphDef = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), [outputNode])
+
+    inputs = [tensors['input_tensor'], tensors['centerbias_tensor']]
+    graphDef = optimize_for_inference_lib.optimize_for_inference(graphDef, [t.op.name for t in inputs], [outputNode], [t.dtype.as_datatype_enum for t in inputs])
+
+    #write to temporary files first so that running jobs never see partial files
+    frozenPath = getFrozenPath(checkPoint)
+    tmpPath = '{}.{}.tmp'.format(frozenPath, os.getpid())
+    with open(tmpPath, 'wb') as f:
+        f.write(graphDef.SerializeToString())
+    os.replace(tmpPath, frozenPath)
+
+    namesPath = getTensorNamesPath(checkPoint)
+    tmpPath = '{}.{}.tmp'.format(namesPath, os.getpid())
+    with open(tmpPath, 'w') as f:
+        json.dump({name: tensor.name for name, tensor in tensors.items()}, f)
+    os.replace(tmpPath, namesPath)
+
+    return frozenPath
+
+
+# run as
+# python3 src/FrozenGraph.py <checkpoint> [<checkpoint> ...]
+# e.g.
+# python3 src/FrozenGraph.py contrib/DeepGazeII/DeepGazeII.ckpt contrib/ICF/ICF.ckpt
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python3 FrozenGraph.py <checkpoint> [<checkpoint> ...]')
+        sys.exit(2)
+
+    for checkPoint in sys.argv[1:]:
+        print('[FrozenGraph] Exported {} to {}'.format(checkPoint, freezeModel(checkPoint)))
@@ -0,0 +1,45 @@
+#shared geometry planes for the attention masks and distance-based weights
+#
+#The central and peripheral masks, the weights of the priority map and the pyramid level maps of the
+#foveation are all functions of the distance of every pixel to a center. The distance planes are
+#computed once per (h, w, center) and kept in a small LRU, so that they are not recomputed for every
+#image and subject. The planes are computed in float64; the float32 planes are rounded from them, which
+#gives the same values as computing in float32 since the squared distances are exact integers and sqrt
+#is correctly rounded.
+#The planes are shared and read-only, callers that need to modify them must copy.
+
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = 8
+
+planes = OrderedDict()
+
+
+#euclidean distance of every pixel of an h x w image to the pixel (cy, cx)
+def getDistancePlane(h, w, cy, cx, dtype=np.float64):
+    key = (int(h), int(w), int(cy), int(cx), np.dtype(dtype).str)
+    if key in planes:
+        planes.move_to_end(key)
+        return planes[key]
+
+    if np.dtype(dtype) == np.float64:
+        dy = np.arange(h, dtype=np.float64) - cy
+        dx = np.arange(w, dtype=np.float64) - cx
+        plane = np.sqrt(dy[:, np.newaxis]**2 + dx[np.newaxis, :]**2)
+    else:
+        plane = getDistancePlane(h, w, cy, cx).astype(dtype)
+    plane.setflags(write=False)
+
+    planes[key] = plane
+    if len(planes) > MAX_ENTRIES:
+        planes.popitem(last=False)
+    return plane
+
+#uint8 mask of the pixels within radius of (cy, cx) (1 inside, 0 outside; inverted if outside is set)
+def getDiskMask(h, w, cy, cx, radius, outside=False):
+    plane = getDistancePlane(h, w, cy, cx)
+    if outside:
+        return (plane > radius).astype(np.uint8)
+    return (plane <= radius).astype(np.uint8)
@@ -1,25 +1,21 @@
-import tensorflow.compat.v1 as tf
 import numpy as np
 from scipy.ndimage import zoom
 from scipy.special import logsumexp
 import cv2
 import time
 
-tf.disable_eager_execution()
+from ShapeBuckets import ShapeBuckets
+from InferenceBackend import getBackend
 
 class ICF:
-    def __init__(self):
+    def __init__(self, bucketSize=0, maxBatch=8, intraOpThreads=0, interOpThreads=0, backend='tensorflow', sess=None, precision='float32'):
         #self.centerbias_template = np.load('contrib/ICF/centerbias.npy')
         check_point = 'contrib/ICF/ICF.ckpt'
-        tf.reset_default_graph()
-        new_saver = tf.train.import_meta_graph('{}.meta'.format(check_point))
+        #sess - TensorFlow session shared with other models (see ModelRegistry)
+        #precision - float32, float16 or int8 (see InferenceBackend)
+        self.backend = getBackend(backend, check_point, intraOpThreads, interOpThreads, sess, 'ICF', precision)
 
-        self.input_tensor = tf.get_collection('input_tensor')[0]
-        self.centerbias_tensor = tf.get_collection('centerbias_tensor')[0]
-        self.log_density = tf.get_collection('log_density')[0]
-
-        self.sess = tf.Session()
-        new_saver.restore(self.sess, check_point)
+        self.buckets = ShapeBuckets(bucketSize, maxBatch)
 
 
     def loadImage(self, img):
@@ -27,18 +23,22 @@ class ICF:
         #centerbias = zoom(self.centerbias_template, (self.img.shape[0]/1024, self.img.shape[1]/1024), order=0, mode='nearest')
         #centerbias -= logsumexp(centerbias)
         #self.centerbias_data = centerbias[np.newaxis, :, :, np.newaxis]
-        self.centerbias_data = np.zeros([1, self.img.shape[0], self.img.shape[1], 1], dtype=np.float32)
+        #the zero center bias is cached by ShapeBuckets
 
     def computeSaliency(self):
-        image_data = self.img[np.newaxis, :, :, :]
-        log_density_prediction = self.sess.run(self.log_density, {
-            self.input_tensor: image_data,
-            self.centerbias_tensor: self.centerbias_data,
-        })
-        log_density = log_density_prediction[0, :, :, 0]
-        #convert to traditional saliency map from log-probability
-        self.sm = np.exp(log_density)
-        self.sm /= np.sum(self.sm)
-        cv2.normalize(self.sm, self.sm, 0, 1, cv2.NORM_MINMAX)
-
+        self.sm = self.computeSaliencyBatch([self.img])[0]
         return self.sm
+
+    #saliency maps of a list of views, views are run in batches (see ShapeBuckets)
+    def computeSaliencyBatch(self, imgs):
+        log_densities = self.buckets.run(self.backend, imgs)
+
+        sms = []
+        for log_density in log_densities:
+            #convert to traditional saliency map from log-probability
+            sm = np.exp(log_density)
+            sm /= np.sum(sm)
+            cv2.normalize(sm, sm, 0, 1, cv2.NORM_MINMAX)
+            sms.append(sm)
+
+        return sms
@@ -0,0 +1,247 @@
+#inference backends for the CNN saliency models (DeepGazeII and ICF)
+#
+#Both models take an image batch and a center bias batch and return the log-density. A backend wraps
+#how the network is executed:
+#   tensorflow - TF1 compat session over the checkpoint (or the frozen graph, see FrozenGraph.py)
+#   onnx - ONNX Runtime on CPU, over <checkpoint>.onnx created with --convert (needs tf2onnx once)
+#The onnx backend can also run the models in reduced precision (inferencePrecision), which lowers the
+#memory traffic of the VGG feature extraction:
+#   float16 - weights and activations in float16 (<checkpoint>.float16.onnx, needs onnxconverter-common)
+#   int8 - dynamic-range quantization, int8 weights and activations quantized per batch
+#          (<checkpoint>.int8.onnx, made with onnxruntime.quantization)
+#The inputs and outputs stay float32 in both cases. Use --parity and --drift to check the effect on the
+#saliency maps and on the fixation sequences.
+#TensorFlow is imported only by the tensorflow backend and the converter, so workers running the
+#onnx backend do not need it.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+BACKENDS = ['tensorflow', 'onnx']
+PRECISIONS = ['float32', 'float16', 'int8']
+
+
+def getONNXPath(checkPoint, precision='float32'):
+    if precision == 'float32':
+        return checkPoint + '.onnx'
+    return '{}.{}.onnx'.format(checkPoint, precision)
+
+def getONNXNamesPath(checkPoint):
+    return checkPoint + '.onnx.json'
+
+
+#sess, scope - shared session and name scope of the model in its graph (see ModelRegistry)
+class TFBackend:
+    def __init__(self, checkPoint, intraOpThreads=0, interOpThreads=0, sess=None, scope=None):
+        from FrozenGraph import loadModel
+        #uses the frozen graph if it was exported with FrozenGraph.py
+        self.sess, self.input_tensor, self.centerbias_tensor, self.log_density = loadModel(checkPoint, intraOpThreads, interOpThreads, sess, scope)
+
+    def run(self, imageData, centerbiasData):
+        return self.sess.run(self.log_density, {
+            self.input_tensor: imageData,
+            self.centerbias_tensor: centerbiasData,
+        })
+
+
+class ONNXBackend:
+    def __init__(self, checkPoint, intraOpThreads=0, interOpThreads=0, precision='float32'):
+        import onnxruntime as ort
+
+        onnxPath = getONNXPath(checkPoint, precision)
+        if not os.path.exists(onnxPath):
+            raise IOError('Cannot find {}! Convert the model with python3 src/InferenceBackend.py --convert --precision {} {}'.format(onnxPath, precision, checkPoint))
+
+        with open(getONNXNamesPath(checkPoint), 'r') as f:
+            self.names = json.load(f)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intraOpThreads
+        options.inter_op_num_threads = interOpThreads
+        self.sess = ort.InferenceSession(onnxPath, options, providers=['CPUExecutionProvider'])
+
+    def run(self, imageData, centerbiasData):
+        return self.sess.run([self.names['log_density']], {
+            self.names['input_tensor']: imageData.astype(np.float32, copy=False),
+            self.names['centerbias_tensor']: centerbiasData,
+        })[0]
+
+
+#sess, scope are only used by the tensorflow backend (ONNX Runtime sessions hold one model each)
+#precision is only supported by the onnx backend
+def getBackend(backend, checkPoint, intraOpThreads=0, interOpThreads=0, sess=None, scope=None, precision='float32'):
+    if backend == 'tensorflow':
+        if precision != 'float32':
+            raise ValueError('inferencePrecision {} requires inferenceBackend = onnx!'.format(precision))
+        return TFBackend(checkPoint, intraOpThreads, interOpThreads, sess, scope)
+    elif backend == 'onnx':
+        return ONNXBackend(checkPoint, intraOpThreads, interOpThreads, precision)
+    raise ValueError('Unrecognized inferenceBackend {}! Use tensorflow or onnx.'.format(backend))
+
+
+#convert the checkpoint (through its frozen graph) to <checkpoint>.onnx
+def convertToONNX(checkPoint, opset=13):
+    import tensorflow.compat.v1 as tf
+    import tf2onnx
+    from FrozenGraph import isFrozen, freezeModel, getFrozenPath, getTensorNamesPath, TENSORS
+
+    if not isFrozen(checkPoint):
+        freezeModel(checkPoint)
+
+    graphDef = tf.GraphDef()
+    with open(getFrozenPath(checkPoint), 'rb') as f:
+        graphDef.ParseFromString(f.read())
+    with open(getTensorNamesPath(checkPoint), 'r') as f:
+        names = json.load(f)
+
+    #write to a temporary file first so that running jobs never see partial files
+    onnxPath = getONNXPath(checkPoint)
+    tmpPath = '{}.{}.tmp'.format(onnxPath, os.getpid())
+    tf2onnx.convert.from_graph_def(graphDef, input_names=[names['input_tensor'], names['centerbias_tensor']],
+                                   output_names=[names['log_density']], opset=opset, output_path=tmpPath)
+    os.replace(tmpPath, onnxPath)
+
+    #tf2onnx keeps the TensorFlow tensor names
+    namesPath = getONNXNamesPath(checkPoint)
+    tmpPath = '{}.{}.tmp'.format(namesPath, os.getpid())
+    with open(tmpPath, 'w') as f:
+        json.dump({name: names[name] for name in TENSORS}, f)
+    os.replace(tmpPath, namesPath)
+
+    return onnxPath
+
+
+#create the reduced precision model <checkpoint>.<precision>.onnx from <checkpoint>.onnx
+def quantizeONNX(checkPoint, precision):
+    onnxPath = getONNXPath(checkPoint)
+    if not os.path.exists(onnxPath):
+        convertToONNX(checkPoint)
+
+    #the tensor names are kept, so <checkpoint>.onnx.json is used for all precisions
+    outPath = getONNXPath(checkPoint, precision)
+    tmpPath = '{}.{}.tmp'.format(outPath, os.getpid())
+    if precision == 'float16':
+        import onnx
+        from onnxconverter_common import float16
+        model = float16.convert_float_to_float16(onnx.load(onnxPath), keep_io_types=True)
+        onnx.save(model, tmpPath)
+    elif precision == 'int8':
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnxPath, tmpPath, weight_type=QuantType.QInt8)
+    else:
+        raise ValueError('Unrecognized precision {}! Use float16 or int8.'.format(precision))
+    os.replace(tmpPath, outPath)
+
+    return outPath
+
+
+#compare the log-density and the saliency map of the onnx backend (in the given precision) against
+#tensorflow, and the time per image of both
+def reportParity(checkPoint, imgPaths, precision='float32'):
+    import time
+    import cv2
+
+    backends = [getBackend('tensorflow', checkPoint), getBackend('onnx', checkPoint, precision=precision)]
+    times = [0, 0]
+    numImages = 0
+
+    for imgPath in imgPaths:
+        img = cv2.imread(imgPath)
+        if img is None:
+            continue
+
+        imageData = img[np.newaxis].astype(np.float32)
+        centerbiasData = np.zeros([1, img.shape[0], img.shape[1], 1], dtype=np.float32)
+
+        logDensities = []
+        sms = []
+        for i, backend in enumerate(backends):
+            t0 = time.time()
+            logDensity = backend.run(imageData, centerbiasData)[0, :, :, 0]
+            times[i] += time.time() - t0
+            sm = np.exp(logDensity)
+            sm /= np.sum(sm)
+            cv2.normalize(sm, sm, 0, 1, cv2.NORM_MINMAX)
+            logDensities.append(logDensity)
+            sms.append(sm)
+        numImages += 1
+
+        print('[InferenceBackend] {}: log-density max abs difference {:0.6f}, saliency map max abs difference {:0.6f}'.format(
+            os.path.basename(imgPath), np.abs(logDensities[0]-logDensities[1]).max(), np.abs(sms[0]-sms[1]).max()))
+
+    if numImages:
+        print('[InferenceBackend] Time per image: tensorflow {:0.03f}s, onnx {} {:0.03f}s'.format(times[0]/numImages, precision, times[1]/numImages))
+
+
+#run STAR-FC on the images of the config file with the models in float32 and in the given precision
+#and report how far the fixation sequences drift apart (the config should use inferenceBackend = onnx)
+def reportDrift(iniPath, precision):
+    from Settings import Settings
+    from Controller import Controller, compareFixationLists
+    from ModelRegistry import unload
+
+    settings = Settings(iniPath, False)
+
+    fixations = {}
+    for p in ['float32', precision]:
+        settings.inferencePrecision = p
+        fixations[p] = Controller(settings).computeFixationLists()
+
+        #do not keep both versions of the weights in memory
+        unload()
+
+    compareFixationLists(fixations['float32'], fixations[precision], '[InferenceBackend]')
+
+
+# run as
+# python3 src/InferenceBackend.py --convert [--precision <precision>] <checkpoint> [<checkpoint> ...]
+# python3 src/InferenceBackend.py --parity [--precision <precision>] <checkpoint> <img_path or dir>
+# python3 src/InferenceBackend.py --drift --precision <precision> <config.ini>
+# e.g.
+# python3 src/InferenceBackend.py --convert contrib/DeepGazeII/DeepGazeII.ckpt contrib/ICF/ICF.ckpt
+# python3 src/InferenceBackend.py --convert --precision int8 contrib/DeepGazeII/DeepGazeII.ckpt contrib/ICF/ICF.ckpt
+# python3 src/InferenceBackend.py --parity --precision int8 contrib/DeepGazeII/DeepGazeII.ckpt images/
+# python3 src/InferenceBackend.py --drift --precision int8 config_files/test.ini
+if __name__ == '__main__':
+    import getopt
+
+    def usage():
+        print('Usage: python3 InferenceBackend.py --convert [--precision <precision>] <checkpoint> [<checkpoint> ...]')
+        print('       python3 InferenceBackend.py --parity [--precision <precision>] <checkpoint> <img_path or dir>')
+        print('       python3 InferenceBackend.py --drift --precision <precision> <config.ini>')
+        print('precision - one of {}'.format(', '.join(PRECISIONS)))
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'h', ['help', 'convert', 'parity', 'drift', 'precision='])
+    except getopt.GetoptError as err:
+        print(str(err))
+        usage()
+        sys.exit(2)
+
+    opts = dict(opts)
+    precision = opts.get('--precision', 'float32')
+    if precision not in PRECISIONS:
+        usage()
+        sys.exit(2)
+
+    if '--convert' in opts and args:
+        for checkPoint in args:
+            if precision == 'float32':
+                print('[InferenceBackend] Converted {} to {}'.format(checkPoint, convertToONNX(checkPoint)))
+            else:
+                print('[InferenceBackend] Converted {} to {}'.format(checkPoint, quantizeONNX(checkPoint, precision)))
+    elif '--drift' in opts and len(args) == 1 and precision != 'float32':
+        reportDrift(args[0], precision)
+    elif '--parity' in opts and len(args) == 2:
+        imgPath = args[1]
+        if os.path.isdir(imgPath):
+            imgPaths = [os.path.join(imgPath, f) for f in sorted(os.listdir(imgPath))]
+        else:
+            imgPaths = [imgPath]
+        reportParity(args[0], imgPaths, precision)
+    else:
+        usage()
+        sys.exit(2)
@@ -0,0 +1,92 @@
+#process-wide registry of the CNN saliency models (DeepGazeII and ICF)
+#
+#Every model is loaded once per process, on first use, and the same instance is handed to every
+#attentional map that asks for it. With the tensorflow backend all models are imported into one
+#shared graph (each under its own name scope, see FrozenGraph.loadModel) and run by one session,
+#so TensorFlow keeps one thread pool and one copy of each set of weights. The thread pools of the
+#shared session are configured by the settings of the first model loaded.
+#Models are unloaded explicitly with unload(); the next getModel() loads them again. Callers should
+#therefore not keep references to the models across an unload (the maps fetch them on every use).
+
+import numpy as np
+
+MODELS = ['DeepGazeII', 'ICF']
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.models = {}
+        self.sess = None
+
+    #one graph and session for all TensorFlow models
+    def getSession(self, settings):
+        if self.sess is None:
+            import tensorflow.compat.v1 as tf
+            from FrozenGraph import getSessionConfig
+            self.sess = tf.Session(graph=tf.Graph(), config=getSessionConfig(settings.tfIntraOpThreads, settings.tfInterOpThreads))
+        return self.sess
+
+    def load(self, name, settings):
+        sess = self.getSession(settings) if settings.inferenceBackend == 'tensorflow' else None
+        args = (settings.inferenceBucketSize, settings.inferenceBatchSize, settings.tfIntraOpThreads, settings.tfInterOpThreads, settings.inferenceBackend, sess, settings.inferencePrecision)
+
+        if name == 'DeepGazeII':
+            from DeepGazeII import DeepGazeII
+            return DeepGazeII(*args)
+        elif name == 'ICF':
+            from ICF import ICF
+            return ICF(*args)
+        raise ValueError('Unrecognized model {}! Use one of {}.'.format(name, ', '.join(MODELS)))
+
+    #returns the model, loading it if needed
+    def getModel(self, name, settings):
+        key = (name, settings.inferenceBackend, settings.inferencePrecision)
+        if key not in self.models:
+            self.models[key] = self.load(name, settings)
+
+        #batching does not depend on the weights, so it follows the settings of the caller
+        model = self.models[key]
+        if (model.buckets.bucketSize, model.buckets.maxBatch) != (settings.inferenceBucketSize, settings.inferenceBatchSize):
+            from ShapeBuckets import ShapeBuckets
+            model.buckets = ShapeBuckets(settings.inferenceBucketSize, settings.inferenceBatchSize)
+        return model
+
+    #load the models and run each once on a blank view of the given shape, so that the first real
+    #fixation does not pay for graph optimization and memory allocation
+    def warmUp(self, names, settings, shape=(256, 256)):
+        for name in names:
+            model = self.getModel(name, settings)
+            model.buckets.run(model.backend, [np.zeros((shape[0], shape[1], 3), dtype=np.float32)])
+
+    #unload the given model (all models if name is None)
+    #nodes cannot be removed from a TensorFlow graph, so the weights of the tensorflow backend are freed
+    #when the last TensorFlow model is unloaded and the shared session is closed
+    def unload(self, name=None):
+        for key in list(self.models):
+            if name is None or key[0] == name:
+                del self.models[key]
+
+        if self.sess is not None and not any(key[1] == 'tensorflow' for key in self.models):
+            self.sess.close()
+            self.sess = None
+
+
+registry = ModelRegistry()
+
+def getModel(name, settings):
+    return registry.getModel(name, settings)
+
+def warmUp(names, settings, shape=(256, 256)):
+    registry.warmUp(names, settings, shape)
+
+def unload(name=None):
+    registry.unload(name)
+
+#names of the registry models used by the settings
+def getModelNames(settings):
+    names = []
+    if 'DeepGazeII' in settings.CentralSalAlgorithm:
+        names.append('DeepGazeII')
+    if 'ICF' in settings.PeriphSalAlgorithm:
+        names.append('ICF')
+    return names
@@ -1,7 +1,5 @@
-import numpy as np
-import math
-import cv2
-
+from SaliencyCache import getSaliencyCache, getModelId, computeCached
+from Geometry import getDiskMask
 
 class PeripheralAttentionalMap:
 
@@ -11,43 +9,81 @@ class PeripheralAttentionalMap:
         self.width = w
         self.salMap = None
         self.periphMap = None
+        self.modelName = None
+        self.sceneSet = False
+        self.cache = getSaliencyCache(settings.saliencyCacheDir, int(settings.saliencyCacheSizeMB*2**20))
 
         if 'AIM' in settings.PeriphSalAlgorithm:
             from AIM import AIM
-            self.buSal = AIM(settings.AIMBasis)
+            self.salModel = AIM(settings.AIMBasis, settings.AIMMode, settings.AIMWisdomPath, settings.AIMRank, settings.AIMEnergy, settings.AIMMemoryBudget, settings.AIMSpillDir, settings.aimThreads, settings.numCores)
         elif 'ICF' in settings.PeriphSalAlgorithm:
-            from ICF import ICF
-            self.buSal = ICF()
+            #loaded on first use, see ModelRegistry
+            self.modelName = 'ICF'
 
         self.initPeripheralMask()
 
 
+    @property
+    def buSal(self):
+        if self.modelName is not None:
+            from ModelRegistry import getModel
+            return getModel(self.modelName, self.settings)
+        return self.salModel
+
     def update(self, h, w, settings):
         self.settings = settings
         self.height = h
         self.width = w
         self.salMap = None
         self.periphMap = None
+        self.sceneSet = False
         self.initPeripheralMask()        
 
     def initPeripheralMask(self):
-        self.periphMask = np.zeros((self.height,self.width), np.uint8)
         centX = round(self.height/2)
         centY = round(self.width/2)
 
         self.settings.pSizePix = self.settings.pSizeDeg*self.settings.pix2deg
         print(self.settings.pSizePix)
-        for i in range(self.height):
-            for j in range(self.width):
-                rad = math.sqrt((i-centX)*(i-centX) + (j-centY)*(j-centY))
-                if (rad <= self.settings.pSizePix):
-                    self.periphMask[i, j] = 0
-                else:
-                    self.periphMask[i, j] = 1
-
-    def computeBUSaliency(self, view):
-        self.buSal.loadImage(view)
-        self.salMap = self.buSal.computeSaliency()
+        #1 farther than pSizePix from the center
+        self.periphMask = getDiskMask(self.height, self.width, centX, centY, self.settings.pSizePix, outside=True)
+
+    #views are crops of scene, so the bottom-up saliency can reuse computation across views
+    #(only AIM supports this and only for some view sizes, see AIM.setScene, otherwise every
+    #view is processed separately)
+    def setScene(self, scene):
+        self.sceneSet = self.buSal.setScene(scene, self.height, self.width)
+        if not self.sceneSet:
+            print('[AIMSceneCache] view size {}x{} cannot be cropped from the resized scene, computing every view separately'.format(self.height, self.width))
+
+    #gazeCoords - position of the view in the scene passed to setScene (if set)
+    def computeBUSaliency(self, view, gazeCoords=None):
+        if gazeCoords is not None and self.sceneSet:
+            self.salMap = self.buSal.computeSaliencyAt(gazeCoords)
+        else:
+            key = None
+            if self.cache is not None:
+                key = self.cache.getKey(view, getModelId(self.settings.PeriphSalAlgorithm, self.settings))
+                self.salMap = self.cache.get(key)
+                if self.salMap is not None:
+                    return
+
+            self.buSal.loadImage(view)
+            self.salMap = self.buSal.computeSaliency()
+            if key is not None:
+                self.salMap = self.cache.put(key, self.salMap)
+
+    #same as computeBUSaliency for a list of views (e.g. of several subjects), returns the list of maps
+    #the views are run in batches if the model supports it (ICF, see ShapeBuckets)
+    def computeBUSaliencyBatch(self, views, gazeCoords=None):
+        if self.modelName is None or (gazeCoords is not None and self.sceneSet):
+            salMaps = []
+            for i, view in enumerate(views):
+                self.computeBUSaliency(view, gazeCoords[i] if gazeCoords is not None else None)
+                salMaps.append(self.salMap)
+            return salMaps
+
+        return computeCached(self.cache, getModelId(self.settings.PeriphSalAlgorithm, self.settings), views, self.buSal.computeSaliencyBatch)
 
     def computePeriphMap(self, mask):
         #blurredPeriphMap = cv2.GaussianBlur(self.salMap,(11,11),0)
@@ -2,6 +2,9 @@ import numpy as np
 import cv2
 import time
 import cProfile
+import hashlib
+
+from Geometry import getDistancePlane
 
 
 class PriorityMap:
@@ -12,6 +15,7 @@ class PriorityMap:
         self.priorityMap = np.zeros((h, w), dtype=np.float32)
         self.nextFixationDirection = (-1, -1)
         self.dist = None
+        self.rng = np.random.RandomState()
         self.initDist()
 
     def reset(self, h, w):
@@ -21,14 +25,16 @@ class PriorityMap:
         self.nextFixationDirection = (-1, -1)
         self.initDist()
 
-    #precompute euclidean distances to the center for every pixel in the image
+    #random fixation selection (nextFixAsMax = off) draws from a generator seeded from key (e.g. image and
+    #subject), so the fixations do not depend on what was computed before or in which process
+    def seedRandom(self, key):
+        self.rng = np.random.RandomState(int(hashlib.sha1(key.encode()).hexdigest()[:8], 16))
+
+    #euclidean distances to the center for every pixel in the image (shared, read-only, see Geometry)
     def initDist(self):
         centX = int(self.height/2)
         centY = int(self.width/2)
-        x, step = np.linspace(0, self.height-1, num=self.height, retstep=True, dtype=np.float32)
-        y, step = np.linspace(0, self.width-1, num=self.width, retstep=True, dtype=np.float32)
-        iy, ix = np.meshgrid(y, x, sparse=False, indexing='xy')
-        self.dist = np.sqrt(np.power(iy-centY, 2) + np.power(ix-centX, 2))
+        self.dist = getDistancePlane(self.height, self.width, centX, centY, np.float32)
 
     #compute a weighted combination of the central and peripheral maps
     def combinePeriphAndCentralWeighted(self, periphMap, centralMap, fixHistMap):
@@ -85,5 +91,5 @@ class PriorityMap:
             priorityMapCopy[priorityMapCopy >= maxVal*self.settings.nextFixThresh] = 1
             priorityMapCopy[priorityMapCopy < maxVal*self.settings.nextFixThresh] = 0
             nonzeroVals = np.flatnonzero(priorityMapCopy)
-            s = np.random.uniform(0, nonzeroVals.shape[0], 1)
+            s = int(self.rng.uniform(0, nonzeroVals.shape[0]))
             self.nextFixationDirection = np.array(np.unravel_index(nonzeroVals[s], self.priorityMap.shape), dtype=np.int32) - np.array([self.height/2, self.width/2], dtype=np.int32)
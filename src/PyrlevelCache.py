@@ -0,0 +1,142 @@
+#cache for the fractional pyramid level maps used by Foveate and Foveate_CPU
+#
+#pyrlevelCones and pyrlevelRods depend only on the view size, gaze position, dotPitch, viewDist,
+#rodsAndCones and the number of pyramid levels, so they are computed once per key and kept
+#in a small in-memory LRU. If a cache directory is given, the maps are also stored there as .npy
+#files and memory-mapped on load, so that restarted jobs and other processes can reuse them.
+
+from collections import OrderedDict
+import hashlib
+import math
+import os
+
+import numpy as np
+
+from Geometry import getDistancePlane
+
+CTO = 1/64 #constant from Geisler & Perry
+ALPHA = 0.106  #constant from Geisler & Perry
+EPSILON2 = 2.3 #constant from Geisler & Perry
+
+
+#use Horner's method to evaluate polynomial
+def evalpoly(x, p, nc):
+    y = np.zeros(x.shape) + p[0]
+    for i in range(1, nc+1):
+        np.multiply(x, y, out=y)
+        y += p[i]
+    return y.astype(np.float32)
+
+
+def computePyrlevels(h, w, gazePos, dotPitch, viewDist, rodsAndCones, numLevels):
+    #eradius is the radial distance between each point and the point of gaze in meters.
+    #the maps are float32, which is what the CUDA kernel of Foveate.py reads
+    distPx = getDistancePlane(h, w, gazePos[0], gazePos[1], np.float32)
+    eradius = distPx*dotPitch
+
+    #ec - eccentricity from the fovea center for each pixel in degrees
+    ec = 180*np.arctan(eradius/viewDist)/math.pi
+
+    eyefreqCones = EPSILON2/(ALPHA*(ec + EPSILON2))*math.log(1/CTO)
+    #eyefreqCones = np.power(eyefreqCones, 0.3)
+
+    maxVal = np.amax(eyefreqCones)
+    minVal = np.amin(eyefreqCones)
+
+    eyefreqCones = (eyefreqCones-minVal)/(maxVal-minVal)
+
+    #pyrlevel is a fractional level of the pyramid which must be used at each pixel
+    #in order to match the foveal resolution function defined above
+    eyefreqCones = 1 - eyefreqCones
+    pyrlevelCones = (numLevels-1)*eyefreqCones
+
+    #constrain pyrlevel to conform to the levels of the pyramid which have been computed
+    pyrlevelCones = np.maximum(0, np.minimum(numLevels, pyrlevelCones))
+
+    pyrlevelRods = None
+    if rodsAndCones:
+        #this is a bit ad hoc
+        #the function was fitted manually in Matlab to resemble distribution of rods in the retina
+        #likely we will need something better for the next version of STAR
+        p = np.array([8.8814e-11,  -1.6852e-07,   1.1048e-04,  -3.1856e-02,   3.7501e+00,  -3.0283e+00])
+        eyefreqRods = evalpoly(distPx, p, 5)
+
+        maxVal = np.amax(eyefreqRods)
+        eyefreqRods = eyefreqRods/maxVal
+        eyefreqRods = 1 - eyefreqRods
+        pyrlevelRods = np.maximum(0, np.minimum(numLevels, numLevels*eyefreqRods+2))
+
+    return pyrlevelCones, pyrlevelRods
+
+
+class PyrlevelCache:
+    def __init__(self, cacheDir=None, maxEntries=8):
+        self.cacheDir = cacheDir
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+
+        if self.cacheDir:
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+    def getKey(self, h, w, gazePos, dotPitch, viewDist, rodsAndCones, numLevels):
+        params = (int(h), int(w), int(gazePos[0]), int(gazePos[1]), float(dotPitch), float(viewDist), bool(rodsAndCones), int(numLevels))
+        return hashlib.sha1(repr(params).encode()).hexdigest()
+
+    def getPyrlevels(self, h, w, gazePos, dotPitch, viewDist, rodsAndCones, numLevels):
+        key = self.getKey(h, w, gazePos, dotPitch, viewDist, rodsAndCones, numLevels)
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        pyrlevels = self.load(key, rodsAndCones)
+        if pyrlevels is None:
+            pyrlevels = computePyrlevels(h, w, gazePos, dotPitch, viewDist, rodsAndCones, numLevels)
+            self.save(key, pyrlevels)
+
+        self.entries[key] = pyrlevels
+        if len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+        return pyrlevels
+
+    def getPath(self, key, name):
+        return os.path.join(self.cacheDir, 'pyrlevel_{}_{}.npy'.format(key, name))
+
+    def load(self, key, rodsAndCones):
+        if not self.cacheDir:
+            return None
+
+        names = ['cones', 'rods'] if rodsAndCones else ['cones']
+        paths = [self.getPath(key, name) for name in names]
+        if not all(os.path.exists(path) for path in paths):
+            return None
+
+        maps = [np.load(path, mmap_mode='r') for path in paths]
+        #written by a version which stored float64 maps
+        if any(pyrlevel.dtype != np.float32 for pyrlevel in maps):
+            return None
+        if not rodsAndCones:
+            maps.append(None)
+        return tuple(maps)
+
+    def save(self, key, pyrlevels):
+        if not self.cacheDir:
+            return
+
+        for name, pyrlevel in zip(['cones', 'rods'], pyrlevels):
+            if pyrlevel is None:
+                continue
+            #write to a temporary file first so that concurrent jobs never see partial files
+            path = self.getPath(key, name)
+            tmpPath = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+            np.save(tmpPath, pyrlevel)
+            os.replace(tmpPath, path)
+
+
+caches = {}
+
+#return the process-wide cache for cacheDir, so it persists across Foveate instances
+def getPyrlevelCache(cacheDir=None):
+    if cacheDir not in caches:
+        caches[cacheDir] = PyrlevelCache(cacheDir)
+    return caches[cacheDir]
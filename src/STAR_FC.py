@@ -1,3 +1,4 @@
+import os
 import sys
 import getopt
 from Settings import Settings
@@ -11,10 +12,11 @@ def usage():
     print('-h, --help\t\t', 'Displays this help')
     print('-c <configFilePath>\t', 'Full path to confi file')
     print('-v,\t\t\t', 'Visualize results')
+    print('-w, --workers <N>\t', 'Run the images of a batch directory in N processes')
 
 def main(argv):
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hc:v', ['help','configFile', 'verbose'])
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:vw:', ['help','configFile', 'verbose', 'workers='])
     except getopt.GetoptError as err:
         print(str(err))
         usage()
@@ -22,6 +24,7 @@ def main(argv):
 
     visualize = False
     iniFilePath = None
+    workers = 1
 
     for o, a in opts:
         if o == "-v":
@@ -31,17 +34,33 @@ def main(argv):
             sys.exit(2)
         elif o == "-c":
             iniFilePath = a
+        elif o in ["-w", "--workers"]:
+            workers = int(a)
 
     if not iniFilePath:
         print('ERROR: .ini config file not provided!')
         usage()
         sys.exit(2)
 
+    if workers > 1 and visualize:
+        print('ERROR: visualization is not supported with several workers!')
+        sys.exit(2)
+
+    #split the cores between the workers, BLAS reads these when numpy is first imported
+    if workers > 1:
+        threads = str(max(1, (os.cpu_count() or 1) // workers))
+        for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+            os.environ.setdefault(var, threads)
+
     from Controller import Controller
 
     settings = Settings(iniFilePath, visualize)
     controller = Controller(settings)
-    controller.run()
+    if workers > 1 and settings.batch:
+        if controller.runWorkers(workers):
+            sys.exit(1)
+    else:
+        controller.run()
 
 if __name__ == '__main__':
     main(sys.argv)
@@ -0,0 +1,143 @@
+#on-disk cache for the outputs of the bottom-up saliency models (AIM, ICF, DeepGazeII, SALICONtf)
+#
+#The saliency map of a view depends only on the view pixels, the model and a few model settings, so it
+#is stored under a hash of these and reused by re-runs (e.g. after changing only the priority map or
+#IOR parameters), duplicate images and restarted jobs. Maps are stored as compressed float16 .npz files
+#(the maps are in [0, 1], so the rounding error is below 0.0005); a computed map is rounded the same
+#way before it is used, so the results do not depend on whether the map came from the cache.
+#The size of the directory is bounded: when it exceeds maxBytes, the least recently used files (by
+#modification time, which is updated on every hit) are removed.
+
+import hashlib
+import os
+import zipfile
+
+import numpy as np
+
+
+#id of the model and of the settings its output depends on (thread counts, batch sizes etc. do not
+#change the output and are left out so that they do not invalidate the cache)
+def getModelId(name, settings):
+    if 'AIM' in name:
+        params = [settings.AIMBasis, settings.AIMMode, settings.AIMMemoryBudget > 0]
+        if settings.AIMMode == 'separable':
+            params += [settings.AIMRank, settings.AIMEnergy]
+    elif 'ICF' in name or 'DeepGazeII' in name:
+        #padding to the bucket shape changes the network input
+        params = [settings.inferenceBackend, settings.inferencePrecision, settings.inferenceBucketSize]
+        if 'DeepGazeII' in name:
+            params.append(settings.centralInferenceScale)
+    else:
+        params = []
+    return '|'.join([name] + [str(param) for param in params])
+
+
+#key of a view for a model
+def getViewKey(view, modelId):
+    view = np.ascontiguousarray(view)
+    h = hashlib.sha1()
+    h.update(repr((modelId, view.shape, view.dtype.str)).encode())
+    h.update(view.data)
+    return h.hexdigest()
+
+
+#maps of a list of views, computeBatch(views) runs the model on a list of views and returns their maps
+#views found in cache (None - no cache) are not run and identical views (e.g. the first views of several
+#subjects) are run only once
+def computeCached(cache, modelId, views, computeBatch):
+    keys = [getViewKey(view, modelId) for view in views]
+    maps = [cache.get(key) if cache is not None else None for key in keys]
+
+    firstIndex = {}
+    for i, key in enumerate(keys):
+        if maps[i] is None:
+            firstIndex.setdefault(key, i)
+    toRun = list(firstIndex.values())
+
+    computedMaps = computeBatch([views[i] for i in toRun]) if toRun else []
+    for i, sm in zip(toRun, computedMaps):
+        maps[i] = cache.put(keys[i], sm) if cache is not None else sm
+
+    for i, key in enumerate(keys):
+        if maps[i] is None:
+            maps[i] = maps[firstIndex[key]].copy()
+    return maps
+
+
+class SaliencyCache:
+    def __init__(self, cacheDir, maxBytes=1 << 30):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+        #approximate size of the directory (other processes may write to it too), recomputed on eviction
+        self.totalBytes = sum(size for _, size, _ in self.listEntries())
+
+    def getKey(self, view, modelId):
+        return getViewKey(view, modelId)
+
+    def getPath(self, key):
+        return os.path.join(self.cacheDir, 'sal_{}.npz'.format(key))
+
+    #returns the cached map or None
+    def get(self, key):
+        path = self.getPath(key)
+        try:
+            with np.load(path) as f:
+                sm = f['sm'].astype(np.float32)
+            os.utime(path)
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            #missing, evicted by another process or partially written by an older version
+            return None
+        return sm
+
+    #store the map, returns it rounded as it is stored
+    def put(self, key, sm):
+        sm16 = sm.astype(np.float16)
+
+        #write to a temporary file first so that concurrent jobs never see partial files
+        path = self.getPath(key)
+        tmpPath = '{}.{}.tmp.npz'.format(path[:-4], os.getpid())
+        np.savez_compressed(tmpPath, sm=sm16)
+        os.replace(tmpPath, path)
+
+        self.totalBytes += os.path.getsize(path)
+        if self.totalBytes > self.maxBytes:
+            self.evict()
+
+        return sm16.astype(np.float32)
+
+    def listEntries(self):
+        entries = []
+        for entry in os.scandir(self.cacheDir):
+            if entry.name.startswith('sal_') and entry.name.endswith('.npz') and '.tmp' not in entry.name:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    #remove the least recently used maps until the directory fits in maxBytes
+    def evict(self):
+        entries = sorted(self.listEntries(), key=lambda entry: entry[2])
+        self.totalBytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.totalBytes -= size
+
+
+caches = {}
+
+#return the process-wide cache for cacheDir (None if the cache is off)
+def getSaliencyCache(cacheDir=None, maxBytes=1 << 30):
+    if not cacheDir:
+        return None
+    if cacheDir not in caches:
+        caches[cacheDir] = SaliencyCache(cacheDir, maxBytes)
+    return caches[cacheDir]
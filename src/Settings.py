@@ -10,10 +10,28 @@ class Settings:
         #input params
         self.input = None
         self.batch = None
+        self.sortBatchBySize = False
 
         #attention map params
         self.PeriphSalAlgorithm = ''
         self.AIMBasis = ''
+        self.AIMMode = ''
+        self.AIMWisdomPath = None
+        self.AIMRank = -1
+        self.AIMEnergy = -1
+        self.AIMMemoryBudget = -1
+        self.AIMSpillDir = None
+        self.aimThreads = -1
+        self.numCores = None #cores this process may use (set by Controller.runWorkers), None - all
+        self.AIMSceneCache = False
+        self.inferenceBucketSize = -1
+        self.inferenceBatchSize = -1
+        self.tfIntraOpThreads = -1
+        self.tfInterOpThreads = -1
+        self.inferenceBackend = ''
+        self.inferencePrecision = ''
+        self.saliencyCacheDir = None
+        self.saliencyCacheSizeMB = -1
         self.CentralSalAlgorithm = ''
         self.pgain = -1
         self.cgain = -1
@@ -22,6 +40,9 @@ class Settings:
         self.nextFixThresh = -1
         self.pSizeDeg = -1
         self.cSizeDeg = -1
+        self.centralROI = False
+        self.centralROIMarginDeg = -1
+        self.centralInferenceScale = -1
         self.iorSizeDeg = -1
         self.iorDecayRate = -1
 
@@ -32,6 +53,10 @@ class Settings:
         self.maxSubjects = -1
         self.paddingRGB = [-1, -1, -1]
         self.foveate = False
+        self.foveateBackend = 'CUDA'
+        self.pyrlevelCacheDir = None
+        self.scenePyramid = False
+        self.foveateBlending = ''
 
         #log params
         self.saveDir = ''
@@ -48,6 +73,7 @@ class Settings:
 
         self.input = iniReader['input_params'].get('input', fallback=None)
         self.batch = iniReader['input_params'].get('batch', fallback=None)
+        self.sortBatchBySize = iniReader['input_params'].getboolean('sortBatchBySize', fallback=False)
 
 
         if self.input and self.batch:
@@ -58,6 +84,22 @@ class Settings:
 
         self.PeriphSalAlgorithm = iniReader['attention_map_params'].get('PeriphSalAlgorithm', fallback='AIM')
         self.AIMBasis = iniReader['attention_map_params'].get('AIMBasis', fallback='data/21infomax950.mat')
+        self.AIMMode = iniReader['attention_map_params'].get('AIMMode', fallback='fft')
+        self.AIMWisdomPath = iniReader['attention_map_params'].get('AIMWisdomPath', fallback=None)
+        self.AIMRank = iniReader['attention_map_params'].getint('AIMRank', fallback=0)
+        self.AIMEnergy = iniReader['attention_map_params'].getfloat('AIMEnergy', fallback=0.99)
+        self.AIMMemoryBudget = iniReader['attention_map_params'].getfloat('AIMMemoryBudget', fallback=0)
+        self.AIMSpillDir = iniReader['attention_map_params'].get('AIMSpillDir', fallback=None)
+        self.aimThreads = iniReader['attention_map_params'].getint('aimThreads', fallback=1)
+        self.AIMSceneCache = iniReader['attention_map_params'].getboolean('AIMSceneCache', fallback=False)
+        self.inferenceBucketSize = iniReader['attention_map_params'].getint('inferenceBucketSize', fallback=0)
+        self.inferenceBatchSize = iniReader['attention_map_params'].getint('inferenceBatchSize', fallback=8)
+        self.tfIntraOpThreads = iniReader['attention_map_params'].getint('tfIntraOpThreads', fallback=0)
+        self.tfInterOpThreads = iniReader['attention_map_params'].getint('tfInterOpThreads', fallback=0)
+        self.inferenceBackend = iniReader['attention_map_params'].get('inferenceBackend', fallback='tensorflow')
+        self.inferencePrecision = iniReader['attention_map_params'].get('inferencePrecision', fallback='float32')
+        self.saliencyCacheDir = iniReader['attention_map_params'].get('saliencyCacheDir', fallback=None)
+        self.saliencyCacheSizeMB = iniReader['attention_map_params'].getfloat('saliencyCacheSizeMB', fallback=1024)
         self.CentralSalAlgorithm = iniReader['attention_map_params'].get('CentralSalAlgorithm', fallback='DeepGazeII')
         self.pgain = iniReader['attention_map_params'].getfloat('pgain')
         self.cgain = iniReader['attention_map_params'].getfloat('cgain', fallback=1.0)
@@ -66,9 +108,18 @@ class Settings:
         self.nextFixThresh = iniReader['attention_map_params'].getfloat('nextFixThresh')
         self.pSizeDeg = iniReader['attention_map_params'].getfloat('pSizeDeg', fallback=9.5)
         self.cSizeDeg = iniReader['attention_map_params'].getfloat('cSizeDeg', fallback=9.6)
+        self.centralROI = iniReader['attention_map_params'].getboolean('centralROI', fallback=False)
+        self.centralROIMarginDeg = iniReader['attention_map_params'].getfloat('centralROIMarginDeg', fallback=3.0)
+        self.centralInferenceScale = iniReader['attention_map_params'].getfloat('centralInferenceScale', fallback=1.0)
         self.iorSizeDeg = iniReader['attention_map_params'].getfloat('iorSizeDeg', fallback=1.5)
         self.iorDecayRate = iniReader['attention_map_params'].getint('iorDecayRate', fallback=10)
 
+        if self.AIMMode not in ['fft', 'reference', 'separable']:
+            raise ValueError('Unrecognized AIMMode {}! Use fft, reference or separable.'.format(self.AIMMode))
+
+        if not 0 < self.centralInferenceScale <= 1:
+            raise ValueError('centralInferenceScale must be in (0, 1]!')
+
         if not self.pgain:
             raise ValueError('pgain value is not provided in the .ini file!')
 
@@ -79,6 +130,10 @@ class Settings:
         self.inputSizeDeg = iniReader['viewing_params'].getfloat('inputSizeDeg')
         self.viewDist = iniReader['viewing_params'].getfloat('viewDist')
         self.foveate = iniReader['viewing_params'].getboolean('foveate', fallback=False)
+        self.foveateBackend = iniReader['viewing_params'].get('foveateBackend', fallback='CUDA')
+        self.pyrlevelCacheDir = iniReader['viewing_params'].get('pyrlevelCacheDir', fallback=None)
+        self.scenePyramid = iniReader['viewing_params'].getboolean('scenePyramid', fallback=False)
+        self.foveateBlending = iniReader['viewing_params'].get('foveateBlending', fallback='bicubic')
         self.rodsAndCones = iniReader['viewing_params'].getboolean('rodsAndCones', fallback=False)
         self.maxNumFixations = iniReader['viewing_params'].getint('maxNumFixations')
         self.numSubjects = iniReader['viewing_params'].getint('numSubjects')
@@ -90,6 +145,24 @@ class Settings:
         if paddingR and paddingG and paddingB:
             self.paddingRGB = [int(paddingR), int(paddingG), int(paddingB)]
 
+        if self.foveateBackend not in ['CUDA', 'CPU']:
+            raise ValueError('Unrecognized foveateBackend {}! Use CUDA or CPU.'.format(self.foveateBackend))
+
+        if self.foveateBlending not in ['linear', 'bicubic']:
+            raise ValueError('Unrecognized foveateBlending {}! Use linear or bicubic.'.format(self.foveateBlending))
+
+        if self.inferenceBackend not in ['tensorflow', 'onnx']:
+            raise ValueError('Unrecognized inferenceBackend {}! Use tensorflow or onnx.'.format(self.inferenceBackend))
+
+        if self.inferencePrecision not in ['float32', 'float16', 'int8']:
+            raise ValueError('Unrecognized inferencePrecision {}! Use float32, float16 or int8.'.format(self.inferencePrecision))
+
+        if self.inferencePrecision != 'float32' and self.inferenceBackend != 'onnx':
+            raise ValueError('inferencePrecision {} requires inferenceBackend = onnx!'.format(self.inferencePrecision))
+
+        if self.AIMSceneCache and (self.foveate or 'AIM' not in self.PeriphSalAlgorithm):
+            raise ValueError('AIMSceneCache requires PeriphSalAlgorithm = AIM and foveate = off!')
+
         if self.nextFixAsMax and self.numSubjects > 1:
             raise ValueError('STAR-FC is running in deterministic mode (nextFixAsMax=True) but numSubjects is > 1')
 
@@ -0,0 +1,76 @@
+#batched inference for the CNN saliency models (DeepGazeII and ICF)
+#
+#Views are grouped by shape and every group is run with one call of the inference backend. If
+#bucketSize > 0, the shapes are rounded up to multiples of bucketSize and views are padded (by
+#replicating the border) to the shape of their bucket, so that views of slightly different sizes
+#share one batch and the backend sees only a few distinct input shapes. The log-density is cropped
+#back to the view size.
+#Padding changes the network input, so the predictions near the right and bottom borders can differ
+#from running the view alone. With bucketSize = 0 only views of the same shape are batched and
+#the results are the same as one backend call per view.
+
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+
+#number of center bias arrays kept (one per batch size and shape)
+MAX_CENTERBIAS = 8
+
+
+class ShapeBuckets:
+    def __init__(self, bucketSize=0, maxBatch=8):
+        self.bucketSize = bucketSize
+        self.maxBatch = maxBatch
+        self.centerbias = OrderedDict()
+
+    def getBucket(self, h, w):
+        if self.bucketSize <= 0:
+            return (h, w)
+        return (-(-h // self.bucketSize)*self.bucketSize, -(-w // self.bucketSize)*self.bucketSize)
+
+    #returns a list of (bucket, indices of the views in this bucket), at most maxBatch views each
+    def group(self, imgs):
+        groups = {}
+        for i, img in enumerate(imgs):
+            groups.setdefault(self.getBucket(img.shape[0], img.shape[1]), []).append(i)
+
+        batches = []
+        for bucket, indices in groups.items():
+            for start in range(0, len(indices), self.maxBatch):
+                batches.append((bucket, indices[start:start+self.maxBatch]))
+        return batches
+
+    #the models are run without center bias (all zeros), so the arrays are reused across calls
+    #(the least recently used ones are dropped, so that many image sizes do not grow it without bound)
+    def getCenterbias(self, n, h, w):
+        key = (n, h, w)
+        if key in self.centerbias:
+            self.centerbias.move_to_end(key)
+            return self.centerbias[key]
+
+        self.centerbias[key] = np.zeros([n, h, w, 1], dtype=np.float32)
+        if len(self.centerbias) > MAX_CENTERBIAS:
+            self.centerbias.popitem(last=False)
+        return self.centerbias[key]
+
+    #returns the log-density of every view (cropped to the view size)
+    #backend - see InferenceBackend
+    def run(self, backend, imgs):
+        logDensities = [None]*len(imgs)
+
+        for bucket, indices in self.group(imgs):
+            imageData = np.empty((len(indices), bucket[0], bucket[1], imgs[indices[0]].shape[2]), dtype=np.float32)
+            for j, i in enumerate(indices):
+                img = imgs[i]
+                if img.shape[:2] == bucket:
+                    imageData[j] = img
+                else:
+                    imageData[j] = cv2.copyMakeBorder(img.astype(np.float32), 0, bucket[0]-img.shape[0], 0, bucket[1]-img.shape[1], cv2.BORDER_REPLICATE)
+
+            logDensityPrediction = backend.run(imageData, self.getCenterbias(len(indices), bucket[0], bucket[1]))
+
+            for j, i in enumerate(indices):
+                logDensities[i] = logDensityPrediction[j, :imgs[i].shape[0], :imgs[i].shape[1], 0]
+
+        return logDensities